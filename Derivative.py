@@ -19,16 +19,101 @@
 # Fivepoint: Takes in an array with the values of the Gaussian curve and 
 #             returns the numerical estimate of the derivative of the function
 #             using the fivepoint stencil method.
+# Stencil: Computes the weights of a finite difference stencil of any order
+#          and width with Fornberg's algorithm and applies them to a whole
+#          column of values at once. The method functions above are all built
+#          on it.
+# Richardson: Estimates the derivative of a callable at a sequence of shrinking
+#             step sizes and extrapolates them to zero step size with a Neville
+#             tableau, stopping once the error estimate meets a tolerance.
+# Chunkedderivative: Applies one of the methods to a memory-mapped signal in
+#                    chunks with overlapping halos, writing to a memory-mapped
+#                    output, so that only one chunk is held in memory at a time.
+# Batchderivative: Differentiates many signals that share one x grid, given
+#                  as the rows of an array, in one pass along the last axis.
+# Gradient, Divergence, Laplacian: Differentiate 2-D and 3-D gridded fields
+#                                  along any axes with the fivepoint or parabolic
+#                                  stencils, on uniform or uneven grids, a block
+#                                  of the field at a time.
+# Spectral: Differentiates periodic signals with FFTs, and with Chebyshev
+#           differentiation on bounded domains, for spectral accuracy on coarse
+#           grids.
+# Errormetrics: Compares a stack of estimates with the closed form derivative in
+#               one pass, giving the RMS, maximum and relative error of each.
+# Samplegrid: Builds the x values start + k*h of a domain at once, sharing
+#             the grids and sampled test functions of recent (domain, h) keys
+#             through a least recently used cache.
+# Convergencestudy: Sweeps the methods over many step sizes for the test
+#                   functions on a pool of processes, fits the order of
+#                   convergence of each method, and saves the error table.
 #
 
 # Imports python modules to assist with math and numerical calculations
 # Numpy: functions to create arrays of specified sizes
-# Math: basic mathematical functions and constants (e, Sin, cos)
+# Sys: the largest integer, used as the print threshold
+# Fractions: exact arithmetic for the cached stencil weights
+# Os, Multiprocessing: the pool of processes of the convergence study
+# Collections: the ordered dictionary of the grid cache
 import numpy as np
 
-import math
+import sys
 
-np.set_printoptions(threshold=np.nan) #prints entire list of values
+import os
+
+import multiprocessing
+
+from fractions import Fraction
+
+from collections import OrderedDict
+
+np.set_printoptions(threshold=sys.maxsize) #prints entire list of values
+
+gridcache = OrderedDict() #the recently used grids and sampled functions, least recent first
+
+gridcachesize = 64 #the most entries kept in gridcache
+
+# This function returns the entry of the cache for the key, building it with the given
+# function if it is missing. The entry is made read-only so it can be shared, and the
+# least recently used entry is dropped once the cache is full.
+# @param key the key of the entry
+# @param build a function of no arguments that builds the entry
+# @return the entry
+#
+def cached(key,build):
+    
+    if(key in gridcache):
+        
+        gridcache.move_to_end(key)
+        
+        return gridcache[key]
+    
+    value = build()
+    
+    value.flags.writeable = False
+    
+    gridcache[key] = value
+    
+    while(len(gridcache) > gridcachesize):
+        
+        gridcache.popitem(last=False)
+        
+    return value
+
+# This function returns the x values start + k*h for k = 0, 1, ... of a domain, computed
+# at once rather than by adding h repeatedly, so they do not drift. The grid is shared
+# through the cache by its (domain, h) key and is read-only.
+# @param h the step size between each x value.
+# @param dom an array of two numbers that specifies the domain of the values.
+# @param count the number of values, or None for every step of the domain
+# @return the read-only array of x values
+#
+def samplegrid(h,dom,count=None):
+    
+    if(count is None):
+        
+        count = int(round((dom[1]-dom[0])/h))+1
+        
+    return cached(("grid",float(dom[0]),float(dom[1]),float(h),count),lambda: dom[0]+np.arange(count)*float(h))
 
 # This function takes in an array of specified length, a step size, and a
 # x domain and returns an array that contains points (x,y) on the given
@@ -43,17 +128,9 @@ np.set_printoptions(threshold=np.nan) #prints entire list of values
 #
 def gaussian(arr,h,dom):
     
-    i = dom[0]
+    arr[:,0] = samplegrid(h,dom,len(arr))
     
-    for l in range(0,len(arr)):
-        
-        arr[l][0] = i
-        
-        i += h
-        
-    for j in range(0,len(arr)):
-        
-        arr[j][1] = math.e ** (-(arr[j][0]*arr[j][0]))
+    arr[:,1] = np.exp(-(arr[:,0]*arr[:,0]))
         
     return arr
 
@@ -70,19 +147,288 @@ def gaussian(arr,h,dom):
 #
 def derivativegauss(arr,h,dom):
     
-    curval = dom[0]
+    arr[:,0] = samplegrid(h,dom,len(arr))
     
-    for l in range(0,len(arr)):
+    arr[:,1] = -2*arr[:,0]*np.exp(-(arr[:,0]*arr[:,0]))
         
-        arr[l][0] = curval
+    return arr
+
+# This function calculates the weights of a finite difference stencil with Fornberg's
+# algorithm: the weights c_k such that sum c_k f(nodes_k) approximates the derivative
+# of the requested order at z, exactly for every polynomial of degree below the number
+# of nodes. The arithmetic is elementwise, so the leading dimensions of nodes (and z)
+# compute one stencil per point at once, and object arrays of Fractions give exact
+# weights.
+# @param z the point (or an array of points) the derivative is estimated at
+# @param nodes an array of node positions, with the nodes of each stencil along the last axis
+# @param order the order of the derivative
+# @return an array shaped like nodes with the weight of each node
+#
+def fornberg(z,nodes,order):
+    
+    nodes = nodes - np.asarray(z)[...,np.newaxis] #the nodes relative to z
     
-        curval += h
+    m = nodes.shape[-1]
+    
+    c = np.zeros(nodes.shape + (order+1,), dtype=nodes.dtype)
+    
+    c[...,0,0] = 1
+    
+    c1 = 1
+    
+    c4 = nodes[...,0]
+    
+    for i in range(1,m):
+        
+        mn = min(i,order)
+        
+        c2 = 1
+        
+        c5 = c4
+        
+        c4 = nodes[...,i]
+        
+        for j in range(0,i):
+            
+            c3 = nodes[...,i] - nodes[...,j]
+            
+            c2 = c2*c3
+            
+            if(j == i-1):
+                
+                for k in range(mn,0,-1):
+                    
+                    c[...,i,k] = c1*(k*c[...,i-1,k-1] - c5*c[...,i-1,k])/c2
+                    
+                c[...,i,0] = -c1*c5*c[...,i-1,0]/c2
+                
+            for k in range(mn,0,-1):
+                
+                c[...,j,k] = (c4*c[...,j,k] - k*c[...,j,k-1])/c3
+                
+            c[...,j,0] = c4*c[...,j,0]/c3
+            
+        c1 = c2
+        
+    return c[...,order]
+
+stencils = {} #cached weights of the uniform stencils, keyed by (order, offsets)
 
-    for j in range(0,len(arr)):
+# This function returns the weights of the uniform stencil with the given integer
+# offsets for a derivative of the given order, for a step size of 1. The weights are
+# computed exactly with Fractions and cached, so each stencil is only derived once.
+# @param order the order of the derivative
+# @param offsets the offsets of the nodes from the point, in steps (e.g. (-1,0,1))
+# @return an array with the weight of each offset
+#
+def stencilweights(order,offsets):
+    
+    key = (order,tuple(offsets))
+    
+    if(key not in stencils):
         
-        arr[j][1] = -2*arr[j][0]* (math.e ** (-(arr[j][0]*arr[j][0])))
+        if(len(set(key[1])) <= order):
+            
+            raise ValueError("a derivative of order %d needs more than %d distinct offsets" % (order,len(set(key[1]))))
         
-    return arr
+        nodes = np.array([Fraction(o) for o in key[1]], dtype=object)
+        
+        weights = fornberg(Fraction(0),nodes,order)
+        
+        stencils[key] = np.array([float(w) for w in weights])
+        
+        stencils[key].flags.writeable = False
+        
+    return stencils[key]
+
+# This function applies a finite difference stencil to a whole column of values at once
+# and returns the estimates at every point that the stencil covers, that is the points
+# -min(offsets) through n - 1 - max(offsets). Each node adds its weight times the column
+# shifted by its offset, so the stencil is applied in one pass per node over every
+# point. With a step size h the cached uniform weights are used; with an x column
+# instead, the weights are computed for every point from its own neighbors, which also
+# handles uneven spacing. Several columns that share the grid can be given as the rows
+# of an array, and are differentiated along the last axis together.
+# @param y the column of function values, or an array of them along the last axis
+# @param order the order of the derivative
+# @param offsets the offsets of the nodes from each point, in samples
+# @param h the step size of a uniform grid
+# @param x the column of x values, used instead of h for uneven spacing
+# @param at the points the derivative is estimated at, one per covered point (default the
+#        x value of the point itself)
+# @param out an array for the estimates at the covered points (optional)
+# @return an array with the estimate at each covered point
+#
+def stencil(y,order=1,offsets=(-2,-1,0,1,2),h=None,x=None,at=None,out=None):
+    
+    offsets = tuple(offsets)
+    
+    y = np.asarray(y,dtype=np.float64)
+    
+    low = -min(min(offsets),0)
+    
+    high = max(max(offsets),0)
+    
+    n = y.shape[-1]
+    
+    count = max(n-low-high,0)
+    
+    if(out is None):
+        
+        out = np.zeros(y.shape[:-1] + (count,))
+        
+    else:
+        
+        out[...] = 0
+        
+    if(count == 0):
+        
+        return out
+    
+    if(x is None):
+        
+        weights = stencilweights(order,offsets)
+        
+    else:
+        
+        nodes = np.stack([x[low+o:low+o+count] for o in offsets],axis=-1)
+        
+        if(at is None):
+            
+            at = x[low:low+count]
+            
+        weights = fornberg(at,nodes,order).T #one row of weights per node
+        
+    for j in range(0,len(offsets)):
+        
+        if(x is None and weights[j] == 0):
+            
+            continue
+        
+        out += weights[j]*y[...,low+offsets[j]:low+offsets[j]+count]
+        
+    if(x is None):
+        
+        out /= h**order
+        
+    return out
+
+# This function takes in an array of (x,y) values and estimates the derivative of the
+# given order with the stencil of the given offsets at every point. As in the method
+# functions, the x values are copied and the points that the stencil does not cover
+# keep their y values.
+# @param arr the array of (x,y) values that you want to estimate
+#        the derivative for.
+# @param order the order of the derivative
+# @param offsets the offsets of the nodes from each point, in samples
+# @param h the stepsize between each given x value, or None to use the x values themselves.
+# @return the array containing all the points (x,y) corresponding to
+#         the estimation of the derivative of the inputed values.
+#
+def derivative(arr,order=1,offsets=(-2,-1,0,1,2),h=None):
+    
+    estimate = np.array(arr[:,0:2],dtype=np.float64)
+    
+    low = -min(min(offsets),0)
+    
+    values = stencil(arr[:,1],order,offsets,h,None if h is not None else arr[:,0])
+    
+    estimate[low:low+len(values),1] = values
+    
+    return estimate
+
+# This function estimates the derivative of a callable by Richardson extrapolation. The
+# central stencil of the requested order is evaluated at the step sizes h, h/factor,
+# h/factor^2, ..., and each new estimate extends a Neville tableau that cancels the
+# even powers of the step size in the error one at a time. The function values are
+# kept by their offset from x, so with the default factor of 2 the outer nodes of each
+# level are the inner nodes of the level before and only two new values are needed per
+# level. A point stops once its error estimate, the change between neighboring entries
+# of the tableau, is below the tolerance times the estimate, or once the diagonal of
+# the tableau grows past twice its best error, which is where round-off takes over.
+# @param f the function, which must accept an array of x values if x is an array
+# @param x the point (or an array of points) the derivative is estimated at
+# @param order the order of the derivative
+# @param h the first (largest) step size; the nodes reach x +- 2h (x +- 3h above the
+#        second order), which must lie in the domain of f
+# @param factor the integer ratio between consecutive step sizes
+# @param tolerance the relative error at which a point stops
+# @param levels the most step sizes to try
+# @return a tuple (derivative, error estimate, number of function evaluations)
+#
+def richardson(f,x,order=1,h=0.1,factor=2,tolerance=1e-13,levels=12):
+    
+    x = np.asarray(x,dtype=np.float64)
+    
+    half = (order+1)//2 + 1
+    
+    offsets = tuple(range(-half,half+1))
+    
+    nodes = [(o,w) for o,w in zip(offsets,stencilweights(order,offsets)) if w != 0]
+    
+    power = 2*((len(offsets)-order+1)//2) #the leading power of h in the error of the stencil
+    
+    values = {} #the function values, keyed by their offset in units of the smallest step
+    
+    best = np.zeros(x.shape)
+    
+    error = np.full(x.shape,np.inf)
+    
+    done = np.zeros(x.shape,dtype=bool)
+    
+    previous = []
+    
+    for i in range(0,levels):
+        
+        step = h/factor**i
+        
+        estimate = np.zeros(x.shape)
+        
+        for o,w in nodes:
+            
+            key = o*factor**(levels-1-i)
+            
+            if(key not in values):
+                
+                values[key] = np.asarray(f(x+o*step),dtype=np.float64)
+                
+            estimate = estimate + w*values[key]
+            
+        row = [estimate/step**order]
+        
+        if(i == 0):
+            
+            best = np.array(row[0])
+            
+        for j in range(1,i+1):
+            
+            row.append(row[j-1] + (row[j-1]-previous[j-1])/(factor**(power+2*(j-1))-1))
+            
+            change = np.maximum(np.abs(row[j]-row[j-1]),np.abs(row[j]-previous[j-1]))
+            
+            better = (change <= error) & ~done
+            
+            best = np.where(better,row[j],best)
+            
+            error = np.where(better,change,error)
+            
+        if(i > 0):
+            
+            done |= error <= tolerance*np.abs(best)
+            
+            done |= np.abs(row[i]-previous[i-1]) >= 2*error
+            
+            if(done.all()):
+                
+                break
+            
+        previous = row
+        
+    if(best.ndim == 0):
+        
+        return float(best),float(error),len(values)
+    
+    return best,error,len(values)
 
 # This function takes in an array of (x,y) values and 
 # estimates the derivative of the function formed by the
@@ -98,27 +444,11 @@ def derivativegauss(arr,h,dom):
 #
 def twopoint(arr):
     
-    twopoint = np.zeros([len(arr),2])
+    twopoint = np.array(arr[:,0:2],dtype=np.float64)
     
-    for i in range(0,len(arr)-1):
-        
-        twopoint[i][0] = (arr[i][0]+arr[i+1][0])/2
-        
-    twopoint[len(arr)-1][0] = arr[len(arr)-1][0]
+    twopoint[:-1,0] = (arr[:-1,0]+arr[1:,0])/2
     
-    for j in range(0,len(arr)-1):
-        
-        pointx = arr[j][0]
-        
-        pointy = arr[j][1]
-        
-        nextx = arr[j+1][0]
-        
-        nexty = arr[j+1][1]
-        
-        twopoint[j][1] = (nexty-pointy)/(nextx-pointx)
-        
-    twopoint[len(arr)-1][1] = arr[len(arr)-1][1]
+    twopoint[:-1,1] = stencil(arr[:,1],1,(0,1),x=arr[:,0],at=twopoint[:-1,0])
     
     return twopoint
 
@@ -135,61 +465,575 @@ def twopoint(arr):
 #
 def threepoint(arr):
     
-    threepoint = np.zeros([len(arr),2])
+    return derivative(arr,1,(-1,1))
+
+# This function takes in an array of (x,y) values and 
+# estimates the derivative of the function formed by the
+# given points using the fivepoint stencil method.
+# @param arr the array of (x,y) values that you want to estimate
+#        the derivative for.
+# @param h the stepsize between the each given x value.
+# @return the array containing all the points (x,y) corresponding to
+#         the estimation of the derivitave of the inputed values using
+#         the fivepoint stencil method.
+#
+def fivepoint(arr,h):
+    
+    return derivative(arr,1,(-2,-1,0,1,2),h)
+
+halos = {"twopoint": (0,1), "threepoint": (1,1), "fivepoint": (2,2), "parabolic": (1,1)} #the neighbors each method reads before and after a point
+
+# This function takes in an array of (x,y) values and estimates the derivative
+# with the method of the given name: "twopoint", "threepoint", "fivepoint" or
+# "parabolic" (the parabolic fit of Derivative2).
+# @param arr the array of (x,y) values that you want to estimate
+#        the derivative for.
+# @param method the name of the method
+# @param h the stepsize between the each given x value (used by fivepoint).
+# @return the array containing all the points (x,y) corresponding to
+#         the estimation of the derivitave of the inputed values.
+#
+def estimate(arr,method,h=None):
+    
+    if(method == "twopoint"):
+        
+        return twopoint(arr)
+    
+    if(method == "threepoint"):
+        
+        return threepoint(arr)
+    
+    if(method == "fivepoint"):
+        
+        return fivepoint(arr,h)
+    
+    if(method == "parabolic"):
+        
+        return derivative(arr,1,(-1,0,1))
+    
+    raise ValueError("unknown method %r, expected one of %s" % (method,", ".join(halos)))
+
+# This function estimates the derivative of a signal too large for memory with the
+# method of the given name. The (x,y) rows are read in chunks, each with the neighbors
+# its stencil reads on either side (its halo), the method is applied to the chunk and
+# halo, and only the rows of the chunk are written out. Every row is computed from the
+# same values with the same arithmetic as in estimate, so the result matches the
+# in-memory path exactly, boundary rows included, and the input is never changed.
+# @param source an N x 2 array of (x,y) values, or the path of a .npy file of them,
+#        which is memory-mapped
+# @param destination an N x 2 array for the result, or the path of a .npy file to
+#        create as a memory map
+# @param method the name of the method, as in estimate
+# @param h the stepsize between the each given x value (used by fivepoint).
+# @param chunk the number of rows computed at a time
+# @return the destination array
+#
+def chunkedderivative(source,destination,method="fivepoint",h=None,chunk=1<<20):
+    
+    if(method not in halos):
+        
+        raise ValueError("unknown method %r, expected one of %s" % (method,", ".join(halos)))
+    
+    if(isinstance(source,str)):
+        
+        source = np.load(source,mmap_mode='r')
+        
+    n = len(source)
     
-    for i in range(0,len(arr)):
+    if(isinstance(destination,str)):
         
-        threepoint[i][0] = arr[i][0]
+        destination = np.lib.format.open_memmap(destination,mode='w+',dtype=np.float64,shape=(n,2))
+        
+    before,after = halos[method]
+    
+    for start in range(0,n,chunk):
         
-    for j in range(1,len(arr)-1):
+        stop = min(start+chunk,n)
         
-        prevx = arr[j-1][0]
+        first = max(start-before,0)
         
-        prevy = arr[j-1][1]
+        last = min(stop+after,n)
         
-        nextx = arr[j+1][0]
+        # rows near the ends of the chunk but not of the signal are fed by the halo, and
+        # the boundary rows of the signal get the same treatment as in memory
+        rows = estimate(np.array(source[first:last],dtype=np.float64),method,h)
         
-        nexty = arr[j+1][1]
+        destination[start:stop] = rows[start-first:stop-first]
         
-        threepoint[j][1] = (nexty-prevy)/(nextx-prevx)
+    if(isinstance(destination,np.memmap)):
         
-    threepoint[len(arr)-1][1] = arr[len(arr)-1][1]
+        destination.flush()
+        
+    return destination
+
+# This function estimates the derivatives of many signals that share one grid at once:
+# each row of values is a signal, and the stencil of the method is applied along the
+# last axis to every row in the same pass. Row k of the result matches the y column of
+# estimate for the (x,y) array of signal k, including its boundary points, which keep
+# their values; for twopoint the estimates are at the midpoints of the grid.
+# @param values an m x n array with one signal per row
+# @param x the n shared x values (used by twopoint, threepoint and parabolic, and for h
+#        when h is not given); a uniform grid with a step of h when not given
+# @param h the stepsize between the each given x value (used by fivepoint); one of x
+#        and h is required
+# @param method the name of the method, as in estimate
+# @param out an m x n array for the result (optional)
+# @return the m x n array of the derivative of each signal
+#
+def batchderivative(values,x=None,h=None,method="fivepoint",out=None):
     
-    threepoint[0][1] = arr[0][1]
+    if(method not in halos):
+        
+        raise ValueError("unknown method %r, expected one of %s" % (method,", ".join(halos)))
+    
+    values = np.asarray(values,dtype=np.float64)
+    
+    n = values.shape[-1]
     
-    return threepoint
+    if(x is not None):
+        
+        x = np.asarray(x,dtype=np.float64)
+        
+    elif(h is not None):
+        
+        x = h*np.arange(n) #the grid only enters through its spacing
+        
+    else:
+        
+        raise ValueError("batchderivative needs the shared x values or the step size h")
+        
+    if(out is None):
+        
+        out = np.empty(values.shape)
+    
+    before,after = halos[method]
+    
+    # the boundary points keep their values, as in the methods for a single signal
+    out[...,:before] = values[...,:before]
+    
+    out[...,max(n-after,0):] = values[...,max(n-after,0):]
+    
+    if(n <= before+after):
+        
+        return out
+    
+    inside = out[...,before:n-after]
+    
+    if(method == "twopoint"):
+        
+        stencil(values,1,(0,1),x=x,at=(x[:-1]+x[1:])/2,out=inside)
+        
+    elif(method == "threepoint"):
+        
+        stencil(values,1,(-1,1),x=x,out=inside)
+        
+    elif(method == "fivepoint"):
+        
+        stencil(values,1,(-2,-1,0,1,2),h=h if h is not None else x[1]-x[0],out=inside)
+        
+    else:
+        
+        stencil(values,1,(-1,0,1),x=x,out=inside)
+        
+    return out
 
-# This function takes in an array of (x,y) values and 
-# estimates the derivative of the function formed by the
-# given points using the fivepoint stencil method.
-# @param arr the array of (x,y) values that you want to estimate
-#        the derivative for.
-# @param h the stepsize between the each given x value.
-# @return the array containing all the points (x,y) corresponding to
-#         the estimation of the derivitave of the inputed values using
-#         the fivepoint stencil method.
+widths = {"fivepoint": 5, "parabolic": 3} #the number of nodes of the stencils of the field operators
+
+# This function returns the stencils that estimate a derivative at every point along one
+# axis of a grid. Every point uses the given number of consecutive nodes, centered on
+# the point where possible and shifted inward near the ends, so that the ends get
+# one-sided stencils of the same width instead of being left out.
+# @param n the number of points along the axis
+# @param spacing the step size of a uniform axis, or the array of the n coordinates of an
+#        uneven one
+# @param order the order of the derivative
+# @param width the number of nodes of each stencil
+# @return a tuple (starts, weights) with the first node of the stencil of each point and
+#         an n x width array of the weights of its nodes
 #
-def fivepoint(arr,h):
+def axisstencils(n,spacing,order,width):
+    
+    width = min(width,n)
+    
+    if(width <= order):
+        
+        raise ValueError("a derivative of order %d needs more than %d points along the axis" % (order,width))
+    
+    low = (width-1)//2
+    
+    starts = np.clip(np.arange(n)-low,0,n-width)
+    
+    if(np.isscalar(spacing)):
+        
+        # only the offsets of the end stencils differ from the centered one
+        weights = np.array([stencilweights(order,tuple(range(s-i,s-i+width))) for s,i in zip(starts,range(n))])/(spacing**order)
+        
+    else:
+        
+        coords = np.asarray(spacing,dtype=np.float64)
+        
+        if(len(coords) != n):
+            
+            raise ValueError("expected %d coordinates along the axis, got %d" % (n,len(coords)))
+        
+        nodes = coords[starts[:,np.newaxis]+np.arange(width)]
+        
+        weights = fornberg(coords,nodes,order)
+        
+    return starts,weights
+
+# This function estimates a partial derivative of a gridded field along one axis. The
+# interior points, which all use the centered stencil, are summed as shifted slices of
+# the field, and only the few points near the ends are done one by one. The field is
+# processed in blocks along another axis so that each pass stays within about the given
+# number of values.
+# @param field the array of values on the grid (any number of dimensions)
+# @param axis the axis to differentiate along
+# @param spacing the step size along the axis, or the array of its coordinates
+# @param order the order of the derivative
+# @param method "fivepoint" or "parabolic", the width of the stencils
+# @param block the largest number of values processed at a time
+# @param out an array shaped like field for the result (optional)
+# @return the array of the partial derivative at every point of the grid
+#
+def partial(field,axis,spacing,order=1,method="fivepoint",block=1<<20,out=None):
+    
+    field = np.asarray(field,dtype=np.float64)
+    
+    if(out is None):
+        
+        out = np.zeros(field.shape)
+        
+    field = np.moveaxis(field,axis,0)
+    
+    result = np.moveaxis(out,axis,0)
+    
+    n = field.shape[0]
+    
+    starts,weights = axisstencils(n,spacing,order,widths[method])
+    
+    width = weights.shape[1]
+    
+    low = (width-1)//2
+    
+    high = n-width+low+1 #one past the last point with the centered stencil
+    
+    shape = (-1,) + (1,)*(field.ndim-1) #broadcasts a weight per point along the axis
+    
+    if(field.ndim > 1):
+        
+        step = max(1,block//max(n*int(np.prod(field.shape[2:])),1))
+        
+        blocks = [(slice(None),slice(start,min(start+step,field.shape[1]))) for start in range(0,field.shape[1],step)]
+        
+    else:
+        
+        blocks = [(slice(None),)]
+        
+    for index in blocks:
+        
+        values = field[index]
+        
+        target = result[index]
+        
+        target[low:high] = 0
+        
+        for j in range(0,width):
+            
+            target[low:high] += weights[low:high,j].reshape(shape)*values[j:j+high-low]
+            
+        for i in list(range(0,low))+list(range(high,n)):
+            
+            target[i] = np.tensordot(weights[i],values[starts[i]:starts[i]+width],axes=1)
+            
+    return out
+
+# This function returns the spacing of one axis from the spacing given for a field: a
+# single step size or array of coordinates for every axis, or a list (or tuple) with
+# one of these per axis.
+# @param spacing the spacing of the field
+# @param axis the axis
+# @param ndim the number of dimensions of the field
+# @return the step size or coordinates of the axis
+#
+def axisspacing(spacing,axis,ndim):
+    
+    if(np.isscalar(spacing)):
+        
+        return spacing
+    
+    if(isinstance(spacing,(list,tuple))):
+        
+        if(len(spacing) != ndim):
+            
+            raise ValueError("expected the spacing of %d axes, got %d" % (ndim,len(spacing)))
+        
+        return spacing[axis]
+    
+    return spacing
+
+# This function estimates the gradient of a gridded field: its partial derivative along
+# each of the requested axes.
+# @param field the array of values on the grid
+# @param spacing a step size or array of coordinates for every axis, or a list of them
+#        with one per axis of the field (coordinates are numpy arrays)
+# @param axes the axes to differentiate along, or None for all of them
+# @param method "fivepoint" or "parabolic"
+# @param block the largest number of values processed at a time
+# @return an array with the partial derivative along each axis stacked along a new first axis
+#
+def gradient(field,spacing,axes=None,method="fivepoint",block=1<<20):
+    
+    field = np.asarray(field,dtype=np.float64)
+    
+    if(axes is None):
+        
+        axes = range(0,field.ndim)
+        
+    axes = list(axes)
+    
+    out = np.zeros((len(axes),) + field.shape)
+    
+    for k in range(0,len(axes)):
+        
+        partial(field,axes[k],axisspacing(spacing,axes[k],field.ndim),1,method,block,out[k])
+        
+    return out
+
+# This function estimates the divergence of a gridded vector field: the sum of the
+# partial derivative of each component along its own axis.
+# @param components the components of the vector field, stacked along the first axis
+# @param spacing a step size or array of coordinates for every axis, or a list of them
+#        with one per axis of the field (coordinates are numpy arrays)
+# @param axes the axis of each component, or None for 0, 1, 2, ...
+# @param method "fivepoint" or "parabolic"
+# @param block the largest number of values processed at a time
+# @return the array of the divergence at every point of the grid
+#
+def divergence(components,spacing,axes=None,method="fivepoint",block=1<<20):
+    
+    if(axes is None):
+        
+        axes = range(0,len(components))
+        
+    axes = list(axes)
+    
+    total = np.zeros(np.shape(components[0]))
+    
+    scratch = np.zeros(total.shape)
+    
+    for k in range(0,len(axes)):
+        
+        total += partial(components[k],axes[k],axisspacing(spacing,axes[k],total.ndim),1,method,block,scratch)
+        
+    return total
+
+# This function estimates the Laplacian of a gridded field: the sum of its second partial
+# derivatives along the requested axes, each taken with a second derivative stencil.
+# @param field the array of values on the grid
+# @param spacing a step size or array of coordinates for every axis, or a list of them
+#        with one per axis of the field (coordinates are numpy arrays)
+# @param axes the axes to sum over, or None for all of them
+# @param method "fivepoint" or "parabolic"
+# @param block the largest number of values processed at a time
+# @return the array of the Laplacian at every point of the grid
+#
+def laplacian(field,spacing,axes=None,method="fivepoint",block=1<<20):
+    
+    field = np.asarray(field,dtype=np.float64)
+    
+    if(axes is None):
+        
+        axes = range(0,field.ndim)
+        
+    total = np.zeros(field.shape)
+    
+    scratch = np.zeros(field.shape)
+    
+    for axis in axes:
+        
+        total += partial(field,axis,axisspacing(spacing,axis,field.ndim),2,method,block,scratch)
+        
+    return total
+
+# This function estimates a derivative of a uniformly sampled periodic signal with the
+# FFT, by multiplying each Fourier mode by (ik)^order. For a signal sampled over one
+# period, without repeating the first point at the end, this is spectrally accurate.
+# The signal must be periodic, since no extension of it past the ends keeps that
+# accuracy: on a bounded domain, sample the function at chebyshevpoints and
+# differentiate it with chebyshev, which is spectrally accurate up to the ends.
+# @param y the column of function values
+# @param h the step size between each x value
+# @param order the order of the derivative
+# @return an array with the estimate at each point
+#
+def spectral(y,h,order=1):
+    
+    values = np.asarray(y,dtype=np.float64)
+    
+    n = len(values)
+    
+    if(n < 2):
+        
+        return np.zeros(n)
+    
+    k = 2*np.pi*np.fft.rfftfreq(n,h)
+    
+    factor = (1j*k)**order
+    
+    if(n % 2 == 0 and order % 2 == 1):
+        
+        factor[-1] = 0 #the Nyquist mode has no derivative of odd order in a real signal
+        
+    return np.fft.irfft(factor*np.fft.rfft(values),n)
+
+# This function returns the n Chebyshev points cos(j pi / (n - 1)) for j = 0 to n - 1,
+# mapped onto a domain. They run from the right end of the domain to the left.
+# @param n the number of points
+# @param dom an array of two numbers that specifies the domain of the values.
+# @return the array of points
+#
+def chebyshevpoints(n,dom):
+    
+    t = np.cos(np.pi*np.arange(n)/max(n-1,1))
+    
+    return (dom[0]+dom[1])/2 + (dom[1]-dom[0])/2*t
+
+# This function returns the Chebyshev differentiation matrix of n points on [-1,1]
+# (Trefethen, Spectral Methods in MATLAB), with each diagonal entry set to minus the sum
+# of the rest of its row for accuracy. The matrix is shared through the grid cache.
+# @param n the number of points
+# @return the read-only n x n matrix
+#
+def chebyshevmatrix(n):
+    
+    def build():
+        
+        if(n == 1):
+            
+            return np.zeros((1,1))
+        
+        t = np.cos(np.pi*np.arange(n)/(n-1))
+        
+        c = np.ones(n)
+        
+        c[0] = c[-1] = 2
+        
+        c *= (-1.0)**np.arange(n)
+        
+        difference = t[:,np.newaxis]-t[np.newaxis,:] + np.eye(n)
+        
+        matrix = np.outer(c,1/c)/difference
+        
+        matrix -= np.diag(matrix.sum(axis=1))
+        
+        return matrix
+    
+    return cached(("chebyshev",n),build)
+
+# This function estimates a derivative of a function sampled at the Chebyshev points of
+# a bounded domain (see chebyshevpoints) by applying the Chebyshev differentiation
+# matrix, which is exact for polynomials of degree below the number of points and
+# converges spectrally for smooth functions.
+# @param y the function values at the Chebyshev points, or an array with one signal per row
+# @param dom an array of two numbers that specifies the domain of the values.
+# @param order the order of the derivative
+# @return an array with the estimate at each point
+#
+def chebyshev(y,dom,order=1):
     
-    fivepoint = np.zeros([len(arr),2])
+    y = np.asarray(y,dtype=np.float64)
     
-    for i in range(0,len(arr)):
+    matrix = chebyshevmatrix(y.shape[-1])
+    
+    scale = 2/(dom[1]-dom[0])
+    
+    for k in range(0,order):
         
-        fivepoint[i][0] = arr[i][0]
+        y = scale*(y @ matrix.T)
         
-    for j in range(2,len(arr)-2):
+    return y
+
+# This function compares any number of derivative estimates with the closed form
+# derivative in a single pass over the rows, in blocks, and returns the RMS error, the
+# largest absolute error, and the relative error (the RMS error over the RMS of the
+# closed form on the same rows, which is inf where the closed form is zero on every
+# compared row, or nan if the error is zero too) of each estimate. The boundary rows
+# that a stencil does not cover can be left out of the comparison.
+# @param actual an array of (x,y) values of the closed form
+#        derivative of an arbitrary function.
+# @param estimates a list of arrays of (x,y) values of the estimates, or an array of
+#        their y values with one row per estimate
+# @param exclude the rows to leave out at the ends: a number of rows at each end, a
+#        (before, after) pair, a method name (see halos), or a list with one of these
+#        per estimate (default none)
+# @param block the number of rows compared at a time
+# @return a dictionary with arrays "rms", "max" and "relative", one value per estimate
+#
+def errormetrics(actual,estimates,exclude=0,block=1<<16):
+    
+    if(isinstance(estimates,np.ndarray) and estimates.ndim == 2):
         
-        fivepoint[j][1] = ((-1*arr[j+2][1])+(8*arr[j+1][1])-(8*arr[j-1][1])+(arr[j-2][1]))/(12*h)
+        columns = [estimates[k] for k in range(len(estimates))]
         
-    fivepoint[len(arr)-1][1] = arr[len(arr)-1][1]
+    else:
+        
+        columns = [np.asarray(e)[:,1] for e in estimates]
+        
+    m = len(columns)
     
-    fivepoint[len(arr)-2][1] = arr[len(arr)-2][1]
+    n = len(actual)
     
-    fivepoint[0][1] = arr[0][1]
+    if(not isinstance(exclude,list)):
+        
+        exclude = [exclude]*m
+        
+    bounds = np.zeros((m,2),dtype=np.int64) #the first and one past the last compared row
     
-    fivepoint[1][1] = arr[1][1]
+    for k in range(0,m):
+        
+        ends = halos[exclude[k]] if isinstance(exclude[k],str) else exclude[k]
+        
+        ends = (ends,ends) if np.isscalar(ends) else ends
+        
+        bounds[k] = (ends[0],n-ends[1])
+        
+    squares = np.zeros(m)
+    
+    largest = np.zeros(m)
     
-    return fivepoint
+    reference = np.zeros(m)
+    
+    for start in range(0,n,block):
+        
+        stop = min(start+block,n)
+        
+        exact = np.asarray(actual[start:stop,1],dtype=np.float64)
+        
+        rows = np.arange(start,stop)
+        
+        inside = (rows >= bounds[:,0:1]) & (rows < bounds[:,1:2])
+        
+        difference = np.where(inside,np.stack([c[start:stop] for c in columns])-exact,0)
+        
+        squares += np.einsum('ij,ij->i',difference,difference)
+        
+        if(difference.shape[1] > 0):
+            
+            largest = np.maximum(largest,np.abs(difference).max(axis=1))
+            
+        reference += np.where(inside,exact*exact,0).sum(axis=1)
+        
+    count = np.maximum(bounds[:,1]-bounds[:,0],1)
+    
+    rms = np.sqrt(squares/count)
+    
+    # against an all-zero closed form any error is infinitely large, and no error is undefined
+    relative = np.where(rms > 0,np.inf,np.nan)
+    
+    np.divide(rms,np.sqrt(reference/count),out=relative,where=reference > 0)
+    
+    return {"rms": rms, "max": largest, "relative": relative}
 
 # This function calculates the RMS error of the 
 # twopoint estimate of an arbitrary function by taking in
@@ -203,15 +1047,7 @@ def fivepoint(arr,h):
 #
 def twopointerror(actual,estimate):
     
-    twopointsum = 0
-    
-    for j in range(0,len(actual)):
-        
-        twopointsum += abs(actual[j][1]-estimate[j][1]) ** 2 
-        
-    twopointrms = math.sqrt(twopointsum/len(estimate))
-    
-    return twopointrms
+    return float(errormetrics(actual,[estimate])["rms"][0])
 
 # This function calculates the RMS error of the 
 # threepoint estimate of an arbitrary function by taking in
@@ -225,15 +1061,7 @@ def twopointerror(actual,estimate):
 #
 def threepointerror(actual,estimate):
     
-    threepointsum = 0
-    
-    for j in range(0,len(actual)):
-        
-        threepointsum += abs(actual[j][1]-estimate[j][1]) ** 2
-        
-    threepointrms = math.sqrt(threepointsum/len(estimate))
-    
-    return threepointrms
+    return float(errormetrics(actual,[estimate])["rms"][0])
 
 # This function calculates the RMS error of the 
 # fivepoint estimate of an arbitrary function by taking in
@@ -247,15 +1075,7 @@ def threepointerror(actual,estimate):
 #
 def fivepointerror(actual,estimate):
     
-    fivepointsum = 0
-    
-    for j in range(0,len(actual)):
-        
-        fivepointsum += abs(actual[j][1]-estimate[j][1]) ** 2
-        
-    fivepointrms = math.sqrt(fivepointsum/len(estimate))
-    
-    return fivepointrms
+    return float(errormetrics(actual,[estimate])["rms"][0])
 
 # This function takes in an array of specified length, a step size, and a
 # x domain and returns an array that contains points (x,y) on the given
@@ -270,17 +1090,13 @@ def fivepointerror(actual,estimate):
 #
 def sincfunc(arr,h,dom):
     
-    currval = dom[0]
+    arr[:,0] = samplegrid(h,dom,len(arr))
     
-    for l in range(0,len(arr)):
-        
-        arr[l][0] = currval
-        
-        currval += h
-        
-    for j in range(0,len(arr)):
-        
-        arr[j][1] = math.sin(arr[j][0])/arr[j][0]
+    x = arr[:,0]
+    
+    zero = x == 0
+    
+    arr[:,1] = np.where(zero,1.0,np.sin(x)/np.where(zero,1.0,x)) #sin(x)/x tends to 1 at 0
         
     return arr
 
@@ -298,21 +1114,166 @@ def sincfunc(arr,h,dom):
 #
 def derivativesinc(arr,h,dom):
     
-    i = dom[0]
+    arr[:,0] = samplegrid(h,dom,len(arr))
+    
+    x = arr[:,0]
+    
+    small = np.abs(x) < 0.1
     
-    for l in range(0,len(arr)):
+    safe = np.where(small,1.0,x)
+    
+    x2 = x*x
+    
+    # near 0 the two terms cancel, so the Taylor series -x/3 + x^3/30 - x^5/840 + ... is used there
+    series = -x*(1/3 - x2*(1/30 - x2*(1/840 - x2*(1/45360 - x2/3991680))))
+    
+    arr[:,1] = np.where(small,series,(np.cos(safe)/safe)-(np.sin(safe)/(safe ** 2)))
         
-        arr[l][0] = i
+    return arr
+
+testfunctions = {"gaussian": (gaussian,derivativegauss), "sinc": (sincfunc,derivativesinc)} #each test function and its closed form derivative
+
+# This function returns a test function, or its closed form derivative, sampled at every
+# step of a domain as an array of (x,y) values. The array is shared through the cache
+# by its (function, domain, h) key and is read-only.
+# @param name the name of the test function (see testfunctions)
+# @param h the step size between each x value.
+# @param dom an array of two numbers that specifies the domain of the values.
+# @param closedform whether to sample the closed form derivative instead of the function
+# @return the read-only array of (x,y) values
+#
+def sampled(name,h,dom,closedform=False):
+    
+    function = testfunctions[name][1 if closedform else 0]
+    
+    count = len(samplegrid(h,dom))
+    
+    return cached((name,closedform,float(dom[0]),float(dom[1]),float(h)),lambda: function(np.zeros([count,2]),h,dom))
+
+# This function runs one job of a convergence study: it samples a test function and its
+# closed form derivative on the domain with the step size, estimates the derivative
+# with the method, and compares the estimate with the closed form on the rows that the
+# method covers, at the x values the estimates belong to.
+# @param job a tuple (function name, method name, h, domain)
+# @return a tuple (RMS error, maximum error, relative error)
+#
+def convergencejob(job):
+    
+    name,method,h,dom = job
+    
+    values = sampled(name,h,dom)
+    
+    # the twopoint estimates belong to the midpoints, the grid shifted by h/2
+    shift = h/2 if method == "twopoint" else 0
+    
+    actual = sampled(name,h,(dom[0]+shift,dom[1]+shift),closedform=True)
+    
+    metrics = errormetrics(actual,[estimate(values,method,h)],exclude=method)
+    
+    return float(metrics["rms"][0]),float(metrics["max"][0]),float(metrics["relative"][0])
+
+# This function fits the order of convergence p of an error that behaves like C h^p, as
+# the slope of log(error) against log(h). Only the step sizes above the one with the
+# smallest error are used (all of them if there are too few), since below it round-off
+# takes over.
+# @param steps the step sizes
+# @param errors the error at each step size
+# @return the fitted order
+#
+def convergenceorder(steps,errors):
+    
+    steps = np.asarray(steps,dtype=np.float64)
+    
+    errors = np.asarray(errors,dtype=np.float64)
+    
+    order = np.argsort(steps)
+    
+    steps,errors = steps[order],errors[order]
+    
+    usable = (errors > 0) & np.isfinite(errors)
+    
+    truncation = usable & (steps > steps[np.argmin(np.where(usable,errors,np.inf))])
+    
+    if(truncation.sum() >= 2):
+        
+        usable = truncation
+        
+    if(usable.sum() < 2):
+        
+        return float("nan")
+    
+    return float(np.polyfit(np.log(steps[usable]),np.log(errors[usable]),1)[0])
+
+# This function runs a convergence study of the derivative methods: every combination of
+# test function, method and step size is a job, the jobs are spread over a pool of
+# processes, and the order of convergence of every method on every function is fitted
+# from the RMS errors. The table of errors against h is returned as a structured array
+# and can be saved as CSV (a .csv path) or as a binary .npy file (any other path).
+# @param functions the names of the test functions (see testfunctions)
+# @param methods the names of the methods (see halos)
+# @param steps the step sizes to sweep
+# @param dom an array of two numbers that specifies the domain of the values
+# @param workers the number of processes, or None for one per core (1 runs serially)
+# @param output the path to save the table to (optional)
+# @param verbose whether to print the table of fitted orders
+# @return a tuple (table, orders) of the structured array of errors and a dictionary of
+#         the fitted order of each (function, method)
+#
+def convergencestudy(functions=("gaussian","sinc"),methods=("twopoint","threepoint","fivepoint","parabolic"),steps=tuple(np.logspace(-3,-0.5,11)),dom=(-10,10),workers=None,output=None,verbose=False):
+    
+    jobs = [(name,method,float(h),tuple(dom)) for name in functions for method in methods for h in steps]
+    
+    if(workers is None):
         
-        i += h
+        workers = os.cpu_count() or 1
         
-    for j in range(0,len(arr)):
+    if(workers > 1 and len(jobs) > 1):
         
-        currx = arr[j][0]
+        start = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
         
-        arr[j][1] = (math.cos(currx)/currx)-(math.sin(currx)/(currx ** 2))
+        with multiprocessing.get_context(start).Pool(min(workers,len(jobs))) as pool:
+            
+            results = pool.map(convergencejob,jobs,chunksize=1)
+            
+    else:
         
-    return arr
+        results = [convergencejob(job) for job in jobs]
+        
+    table = np.zeros(len(jobs),dtype=[("function","U16"),("method","U16"),("h","f8"),("rms","f8"),("max","f8"),("relative","f8")])
+    
+    for k in range(0,len(jobs)):
+        
+        table[k] = (jobs[k][0],jobs[k][1],jobs[k][2]) + results[k]
+        
+    orders = {}
+    
+    for name in functions:
+        
+        for method in methods:
+            
+            rows = table[(table["function"] == name) & (table["method"] == method)]
+            
+            orders[(name,method)] = convergenceorder(rows["h"],rows["rms"])
+            
+    if(output is not None):
+        
+        if(output.lower().endswith(".csv")):
+            
+            np.savetxt(output,table,fmt=["%s","%s","%.17g","%.17g","%.17g","%.17g"],delimiter=",",header=",".join(table.dtype.names),comments="")
+            
+        else:
+            
+            np.save(output,table)
+            
+    if(verbose):
+        
+        print("function\tmethod\torder")
+        
+        for (name,method),order in orders.items():
+            
+            print("%s\t%s\t%.3f" % (name,method,order))
+            
+    return table,orders
 
 # This function utilizes all of the previously defined functions to store the 
 # functions and their derivative estimations in arrays. This function also establishes
@@ -342,11 +1303,9 @@ def main():
     
     fivepointestimategauss = fivepoint(gauss,h)
     
-    twopointrmserrorgauss = twopointerror(derivgauss,twopointestimategauss)
+    errorsgauss = errormetrics(derivgauss,[twopointestimategauss,threepointestimategauss,fivepointestimategauss])
     
-    threepointrmserrorgauss = threepointerror(derivgauss,threepointestimategauss)
-    
-    fivepointrmserrorgauss = fivepointerror(derivgauss,fivepointestimategauss)
+    twopointrmserrorgauss,threepointrmserrorgauss,fivepointrmserrorgauss = errorsgauss["rms"]
     
     #Sinc Function
     
@@ -360,14 +1319,14 @@ def main():
     
     fivepointestimatesinc = fivepoint(sinc,h)
     
-    twopointrmserrorsinc = twopointerror(derivsinc,twopointestimatesinc)
-    
-    threepointrmserrorsinc = threepointerror(derivsinc,threepointestimatesinc)
+    errorssinc = errormetrics(derivsinc,[twopointestimatesinc,threepointestimatesinc,fivepointestimatesinc])
     
-    fivepointrmserrorsinc = fivepointerror(derivsinc,fivepointestimatesinc)
+    twopointrmserrorsinc,threepointrmserrorsinc,fivepointrmserrorsinc = errorssinc["rms"]
 
     #def main
 
-#Calls the main method.
-main()
+#Calls the main method when run as a script.
+if(__name__ == "__main__"):
+    
+    main()
     
\ No newline at end of file
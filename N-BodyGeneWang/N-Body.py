@@ -11,10 +11,27 @@
 # as well as plots
 # Numpy: functions to create arrays of specified sizes
 # Math: basic mathematical functions and constants (e, Sin, cos)
+# Os, Threading, Multiprocessing: worker processes and shared memory for parallel forces
+# Queue, Json: the background checkpoint writer and the saved run settings
+# Time: wall-clock timers for the performance reports
 # Matplotlib: plotting software in python
 # Axes3D: allows for 3D plots of the objects.
 import math
 
+import os
+
+import threading
+
+import queue
+
+import json
+
+import multiprocessing
+
+from multiprocessing import shared_memory
+
+import time as timer
+
 import numpy as np
 
 import matplotlib.pyplot as plt
@@ -25,12 +42,21 @@ pi = np.arccos(-1) #establishes a numerical constant value for PI
 
 G = 6.674e-11 #m^3⋅kg−1⋅s−2 #establishes a numerical constant value for G
 
+solarmass = 1.98e30 #kg #the mass unit of a Star
+
+parsec = 3.086e16 #m
+
 # This class defines the methods and initializes the variables for a Star object.
 # An object of the class Star has variables that describe its position in space
-# (as a vector), its mass, and its velocity (as a vector).
+# (as a vector), its mass, and its velocity (as a vector). A Star that has been
+# bound to a StarSystem is a thin view of one row of the arrays of that system, so
+# its getters and setters read and write the shared arrays instead of its own variables.
+# Star declares __slots__, so it carries no per-instance __dict__.
 #
 class Star:
     
+    __slots__ = ('pos', 'mass', 'v', 'system', 'index')
+    
     # Constructor initializes all of the instance variables upon
     # instantiation of the object.
     # @param self the bound version of this object
@@ -47,14 +73,24 @@ class Star:
         
         self.pos = Vector(selfx,selfy,selfz)
         
-        self.mass = mass * 1.98e30 #changes the solar mass value to kg
+        self.mass = mass * solarmass #changes the solar mass value to kg
+        
+        self.v = Vector(velocity.getx(),velocity.gety(),velocity.getz()) #copied so that in-place kicks never alter a shared Vector
+        
+        self.system = None #the StarSystem this Star is a view of, if any
         
-        self.v = velocity
+        self.index = 0 #the row of this Star in the arrays of its StarSystem
         
     # This function returns the current position of the Star object
     # @param self the bound version of this object
     # @return a Vector with the current position of the object
     def getpos(self):
+        
+        if(self.system is not None):
+            
+            row = self.system.pos[self.index]
+            
+            return Vector(row[0],row[1],row[2])
             
         return self.pos
     
@@ -64,12 +100,22 @@ class Star:
     # @param vector the vector position that you want to set the position of this object to
     def setpos(self,vector):
         
-        self.pos = vector
+        if(self.system is not None):
+            
+            self.system.pos[self.index] = (vector.getx(),vector.gety(),vector.getz())
+            
+        else:
+            
+            self.pos = vector
         
     # This function returns the current mass of the Star object
     # @param self the bound version of this object
     # @return the current mass of the object
     def getmass(self):
+        
+        if(self.system is not None):
+            
+            return self.system.mass[self.index]
             
         return self.mass
     
@@ -79,12 +125,24 @@ class Star:
     # @param val the mass value that you want to set the mass of this object to
     def setmass(self,val):
         
-        self.mass = val
+        if(self.system is not None):
+            
+            self.system.mass[self.index] = val
+            
+        else:
+            
+            self.mass = val
         
     # This function returns the current velocity of the Star object
     # @param self the bound version of this object
     # @return the current velocity of the object as a vector
     def getvelocity(self):
+        
+        if(self.system is not None):
+            
+            row = self.system.v[self.index]
+            
+            return Vector(row[0],row[1],row[2])
             
         return self.v
     
@@ -94,14 +152,60 @@ class Star:
     # @param vector the vector velocity that you want to set the velocity of this object to
     def setvelocity(self,vector):
         
-        self.v = vector
+        if(self.system is not None):
+            
+            self.system.v[self.index] = (vector.getx(),vector.gety(),vector.getz())
+            
+        else:
+            
+            self.v = vector
+            
+    # This function changes the velocity of the Star object in place by the
+    # given acceleration over the given change in time, without allocating a Vector.
+    # @param self the bound version of this object
+    # @param ax the x component of the acceleration
+    # @param ay the y component of the acceleration
+    # @param az the z component of the acceleration
+    # @param delt the change in time
+    def kick(self,ax,ay,az,delt):
+        
+        if(self.system is not None):
+            
+            row = self.system.v[self.index]
+            
+            row[0] += ax * delt
+            
+            row[1] += ay * delt
+            
+            row[2] += az * delt
+            
+        else:
+            
+            self.v.setcomponents(self.v.x + ax * delt, self.v.y + ay * delt, self.v.z + az * delt)
+            
+    # This function moves the position of the Star object in place by its
+    # velocity over the given change in time, without allocating a Vector.
+    # @param self the bound version of this object
+    # @param delt the change in time
+    def drift(self,delt):
+        
+        if(self.system is not None):
+            
+            self.system.pos[self.index] += self.system.v[self.index] * delt
+            
+        else:
+            
+            self.pos.setcomponents(self.pos.x + self.v.x * delt, self.pos.y + self.v.y * delt, self.pos.z + self.v.z * delt)
 
 # This class defines the methods and initializes the variables for a Vector object.
 # An object of the class Vector has variables that describe three different components
 # for a three dimensional vector, and contains methods to change and acquire these values.
+# Vector declares __slots__, so it carries no per-instance __dict__.
 #
 class Vector:
     
+    __slots__ = ('x', 'y', 'z')
+    
     # Constructor initializes all of the instance variables upon
     # instantiation of the object.
     # @param self the bound version of this object
@@ -116,7 +220,6 @@ class Vector:
         
         self.z = zposition
         
-        
     # This function returns the x component value of the vector
     # @param self the bound version of this object
     def getx(self):
@@ -134,13 +237,35 @@ class Vector:
     def getz(self):
         
         return self.z
+    
+    # This function sets all three components of the vector in place
+    # @param self the bound version of this object
+    # @param xposition the new x component of the Vector
+    # @param yposition the new y component of the Vector
+    # @param zposition the new z component of the Vector
+    # @return this vector
+    def setcomponents(self, xposition, yposition, zposition):
+        
+        self.x = xposition
+        
+        self.y = yposition
+        
+        self.z = zposition
+        
+        return self
 
 # This function takes in two separate vectors and adds them together using vector addition.
+# If an output vector is given, the sum is written into it instead of a new vector.
 # @param vector1 the first vector to add
 # @param vector2 the second vector to add
-# @return a new vector that represents the sum of the 2 given vectors.
+# @param out the vector to store the sum in (optional)
+# @return a vector that represents the sum of the 2 given vectors.
 #
-def addition(vector1,vector2):
+def addition(vector1,vector2,out=None):
+    
+    if(out is not None):
+        
+        return out.setcomponents(vector1.getx()+vector2.getx(), vector1.gety()+vector2.gety(), vector1.getz()+vector2.getz())
     
     newvector = Vector(vector1.getx()+vector2.getx(), vector1.gety()+vector2.gety(), vector1.getz()+vector2.getz())
     
@@ -148,11 +273,17 @@ def addition(vector1,vector2):
 
 # This function takes in two separate vectors and subtracts the second vector 
 # from the first using vector subtraction.
+# If an output vector is given, the difference is written into it instead of a new vector.
 # @param vector1 the first vector
 # @param vector2 the second vector to subtract from the first
-# @return a new vector that represents the difference of the 2 given vectors.
+# @param out the vector to store the difference in (optional)
+# @return a vector that represents the difference of the 2 given vectors.
 #
-def difference(vector1,vector2):
+def difference(vector1,vector2,out=None):
+    
+    if(out is not None):
+        
+        return out.setcomponents(vector1.getx()-vector2.getx(), vector1.gety()-vector2.gety(), vector1.getz()-vector2.getz())
     
     newvector = Vector(vector1.getx()-vector2.getx(), vector1.gety()-vector2.gety(), vector1.getz()-vector2.getz())
     
@@ -166,110 +297,3800 @@ def magnitude(vector):
 
     return (math.sqrt(vector.getx()*vector.getx()+vector.gety()*vector.gety()+vector.getz()*vector.getz()))
 
-# This function takes in a list of Star objects, a time period, and a 
-# change in time, and allows the Star objects to evolve based on the interactions
-# due to gravitational attraction until the given time is up.
-# The gravitational forces are modeled by the equations 11 and 12 in the design document.
-# @param stars the array with stars 
-# @param time the total amount of time in seconds
-# @param delt the change in time
+maxpairs = 2 ** 22 #largest number of pairwise separations held in memory at once by the force kernel
+
+# This class defines the methods and initializes the variables for a StarSystem object.
+# An object of the class StarSystem stores the positions, velocities, and masses of all
+# of its bodies in contiguous arrays (N x 3, N x 3, and N) so that the gravitational
+# attraction between every pair of bodies can be computed in one vectorized pass.
+# Star objects bound to the system are views of one row of these arrays.
 #
+class StarSystem:
+    
+    # Constructor initializes all of the instance variables upon
+    # instantiation of the object. The given arrays are copied.
+    # @param self the bound version of this object
+    # @param positions an N x 3 array with the position of each body (in meters)
+    # @param velocities an N x 3 array with the velocity of each body (in m/s)
+    # @param masses an array with the mass of each of the N bodies (in kg)
+    def __init__(self, positions, velocities, masses):
+        
+        self.pos = np.array(positions, dtype=np.float64).reshape(-1,3)
+        
+        self.v = np.array(velocities, dtype=np.float64).reshape(-1,3)
+        
+        self.mass = np.array(masses, dtype=np.float64).reshape(-1)
+        
+        self.stars = {} #the Star objects that are views of this system, by row
+        
+        self.acc = None #the accelerations at the current positions, kept between steps by the integrators
+        
+        self.level = None #the timestep level of each body for the block integrator
+        
+    # This function returns the number of bodies in the system
+    # @param self the bound version of this object
+    # @return the number of bodies
+    def __len__(self):
+        
+        return len(self.mass)
+    
+    # This function returns the Star view of the body at the given row,
+    # creating and binding a new Star if the row does not have one yet.
+    # @param self the bound version of this object
+    # @param index the row of the requested body
+    # @return a Star that reads and writes the given row of the system
+    def getstar(self,index):
+        
+        if(index in self.stars):
+            
+            return self.stars[index]
+            
+        star = Star(Vector(0,0,0),0,Vector(0,0,0))
+        
+        star.system = self
+        
+        star.index = index
+        
+        self.stars[index] = star
+        
+        return star
+
+# This function takes in a list of Star objects and returns the StarSystem that holds
+# their state. If the stars are already bound, in order, to one system then that system
+# is reused; otherwise their positions, velocities and masses are copied into a new
+# system and every star is bound to its row so that existing references stay current.
+# @param stars the list of Star objects
+# @return the StarSystem holding the state of the stars
 #
-def evolve(stars, time, delt):
+def makesystem(stars):
     
-    counter = 0
+    system = stars[0].system if len(stars) > 0 else None
     
-    while(counter <= time):
+    if(system is not None and len(system) == len(stars)):
+        
+        if(all(star.system is system and star.index == i for i, star in enumerate(stars))):
+            
+            return system
+    
+    positions = [(s.getpos().getx(), s.getpos().gety(), s.getpos().getz()) for s in stars]
+    
+    velocities = [(s.getvelocity().getx(), s.getvelocity().gety(), s.getvelocity().getz()) for s in stars]
+    
+    masses = [s.getmass() for s in stars]
+    
+    system = StarSystem(positions, velocities, masses)
+    
+    for i, star in enumerate(stars):
+        
+        star.system = system
+        
+        star.index = i
+        
+    system.stars = {i: star for i, star in enumerate(stars)}
+    
+    return system
+
+# This function builds a StarSystem that takes over the given float64 arrays instead of
+# copying them, for the bulk generators and loaders that have just built them.
+# @param pos an N x 3 float64 array of positions (in meters)
+# @param v an N x 3 float64 array of velocities (in m/s)
+# @param mass a float64 array of N masses (in kg)
+# @return the StarSystem holding the arrays
+#
+def adoptsystem(pos, v, mass):
+    
+    system = StarSystem(np.empty((0,3)), np.empty((0,3)), np.empty(0))
+    
+    system.pos = pos
+    
+    system.v = v
+    
+    system.mass = mass
+    
+    return system
+
+# This function returns an N x 3 array of random unit vectors, uniform on the sphere.
+# @param rng the numpy random Generator
+# @param n the number of vectors
+# @return an N x 3 array of unit vectors
+#
+def randomdirections(rng, n):
+    
+    cos = rng.uniform(-1, 1, n)
+    
+    sin = np.sqrt(1 - cos * cos)
+    
+    phi = rng.uniform(0, 2 * pi, n)
+    
+    return np.stack((sin * np.cos(phi), sin * np.sin(phi), cos), axis=1)
+
+# This function moves a system to the frame of its center of mass, so that the center of
+# mass is at the origin and at rest.
+# @param pos an N x 3 array of positions, changed in place
+# @param v an N x 3 array of velocities, changed in place
+# @param mass an array of N masses
+#
+def centerofmass(pos, v, mass):
+    
+    pos -= (mass @ pos) / mass.sum()
+    
+    v -= (mass @ v) / mass.sum()
+
+# This function generates a Plummer sphere of equal-mass bodies in virial equilibrium,
+# sampling the radii from the inverse of the cumulative mass and the speeds by rejection
+# (Aarseth, Henon and Wielen 1974), all at once. Radii beyond 100 scale radii are
+# redrawn.
+# @param n the number of bodies
+# @param mass the total mass (in solar masses)
+# @param radius the Plummer scale radius (in meters)
+# @param seed the seed of the random numbers (optional)
+# @return the StarSystem of the sphere, centered on its center of mass
+#
+def plummer(n, mass, radius, seed=None):
+    
+    rng = np.random.default_rng(seed)
+    
+    total = mass * solarmass
+    
+    fraction = rng.uniform(0, 1, n)
+    
+    # the cumulative mass fraction of 100 scale radii is (1 + 1e-4)^-1.5
+    fraction *= (1 + 1e-4) ** -1.5
+    
+    r = 1 / np.sqrt(fraction ** (-2/3) - 1)
+    
+    # q = v / v_escape has the density q^2 (1 - q^2)^3.5, below 0.1 everywhere
+    q = np.empty(n)
+    
+    left = np.arange(n)
+    
+    while(len(left) > 0):
+        
+        x = rng.uniform(0, 1, len(left))
+        
+        y = rng.uniform(0, 0.1, len(left))
+        
+        accept = y < x * x * (1 - x * x) ** 3.5
+        
+        q[left[accept]] = x[accept]
+        
+        left = left[~accept]
+        
+    escape = np.sqrt(2) * (1 + r * r) ** -0.25
+    
+    pos = radius * r[:, np.newaxis] * randomdirections(rng, n)
+    
+    v = math.sqrt(G * total / radius) * (q * escape)[:, np.newaxis] * randomdirections(rng, n)
+    
+    masses = np.full(n, total / n)
+    
+    centerofmass(pos, v, masses)
+    
+    return adoptsystem(pos, v, masses)
+
+# This function solves the Poisson equation of a King model with central potential w0
+# in units of the King radius and the velocity dispersion, where it reads
+# W'' + 2 W' / r = -9 rho(W) / rho(w0). It returns tables of the radius, the potential
+# W and the enclosed mass out to the tidal radius, where W falls to zero.
+# @param w0 the dimensionless central potential
+# @return a tuple of three arrays (r, W, enclosed mass)
+#
+def kingprofile(w0):
+    
+    def density(w):
+        
+        if(w <= 0):
+            
+            return 0.0
+        
+        return math.exp(w) * math.erf(math.sqrt(w)) - math.sqrt(4 * w / pi) * (1 + 2 * w / 3)
+    
+    central = density(w0)
+    
+    def derivatives(r, state):
+        
+        w, dw, m = state
+        
+        rho = density(w) / central
+        
+        return (dw, -9 * rho - 2 * dw / r, 4 * pi * r * r * rho)
+    
+    r = 1e-4
+    
+    state = (w0 - 1.5 * r * r, -3 * r, 4 * pi * r**3 / 3) #the series solution near the center
+    
+    radii = [0.0, r]
+    
+    potentials = [w0, state[0]]
+    
+    masses = [0.0, state[2]]
+    
+    while(state[0] > 0):
+        
+        h = 0.01 * max(r, 0.01)
+        
+        k1 = derivatives(r, state)
+        
+        k2 = derivatives(r + h/2, [state[i] + h/2 * k1[i] for i in range(3)])
+        
+        k3 = derivatives(r + h/2, [state[i] + h/2 * k2[i] for i in range(3)])
+        
+        k4 = derivatives(r + h, [state[i] + h * k3[i] for i in range(3)])
+        
+        state = [state[i] + h/6 * (k1[i] + 2 * k2[i] + 2 * k3[i] + k4[i]) for i in range(3)]
+        
+        r += h
+        
+        radii.append(r)
+        
+        potentials.append(max(state[0], 0.0))
+        
+        masses.append(state[2])
+        
+    return np.array(radii), np.array(potentials), np.array(masses)
+
+# This function generates a King model of equal-mass bodies. The radii are sampled from
+# the tabulated enclosed mass of kingprofile, and the velocities from the lowered
+# Maxwellian f(E) ~ exp(W - v^2 / 2) - 1 by rejection from a uniform ball in velocity
+# space, all at once.
+# @param n the number of bodies
+# @param mass the total mass (in solar masses)
+# @param radius the King core radius (in meters)
+# @param w0 the dimensionless central potential, which sets the concentration (default 6)
+# @param seed the seed of the random numbers (optional)
+# @return the StarSystem of the model, centered on its center of mass
+#
+def king(n, mass, radius, w0=6, seed=None):
+    
+    rng = np.random.default_rng(seed)
+    
+    total = mass * solarmass
+    
+    radii, potentials, masses = kingprofile(w0)
+    
+    r = np.interp(rng.uniform(0, masses[-1], n), masses, radii)
+    
+    w = np.interp(r, radii, potentials)
+    
+    speed = np.empty(n)
+    
+    left = np.arange(n)
+    
+    while(len(left) > 0):
+        
+        top = np.sqrt(2 * w[left])
+        
+        candidate = top * rng.uniform(0, 1, len(left)) ** (1/3)
+        
+        accept = rng.uniform(0, 1, len(left)) * np.expm1(w[left]) < np.expm1(w[left] - candidate * candidate / 2)
+        
+        speed[left[accept]] = candidate[accept]
+        
+        left = left[~accept]
+        
+    # in these units G = 9 / (4 pi), which sets the velocity dispersion of the given mass
+    dispersion = math.sqrt(G * total / (radius * 9 / (4 * pi) * masses[-1]))
+    
+    pos = radius * r[:, np.newaxis] * randomdirections(rng, n)
+    
+    v = dispersion * speed[:, np.newaxis] * randomdirections(rng, n)
+    
+    masses = np.full(n, total / n)
+    
+    centerofmass(pos, v, masses)
+    
+    return adoptsystem(pos, v, masses)
+
+# This function generates a thin disk of equal-mass bodies with a uniform surface density
+# in the xy plane, optionally around a central body, on circular orbits about the z axis.
+# The circular speeds use the enclosed mass as if it were spherical, which is exact for
+# the central body and an approximation for the disk itself.
+# @param n the number of disk bodies
+# @param mass the total mass of the disk (in solar masses)
+# @param radius the radius of the disk (in meters)
+# @param central the mass of a body at the center, or 0 for none (in solar masses)
+# @param thickness the standard deviation of the heights above the plane (in meters)
+# @param seed the seed of the random numbers (optional)
+# @return the StarSystem of the disk, with the central body (if any) first
+#
+def uniformdisk(n, mass, radius, central=0, thickness=0, seed=None):
+    
+    rng = np.random.default_rng(seed)
+    
+    total = mass * solarmass
+    
+    r = radius * np.sqrt(rng.uniform(0, 1, n))
     
-        for star1 in stars:
+    phi = rng.uniform(0, 2 * pi, n)
+    
+    pos = np.stack((r * np.cos(phi), r * np.sin(phi), thickness * rng.standard_normal(n)), axis=1)
+    
+    enclosed = central * solarmass + total * (r / radius) ** 2
+    
+    speed = np.sqrt(G * enclosed / np.where(r > 0, r, 1)) * (r > 0)
+    
+    v = np.stack((-speed * np.sin(phi), speed * np.cos(phi), np.zeros(n)), axis=1)
+    
+    masses = np.full(n, total / n)
+    
+    if(central > 0):
+        
+        pos = np.concatenate((np.zeros((1,3)), pos))
+        
+        v = np.concatenate((np.zeros((1,3)), v))
+        
+        masses = np.concatenate(([central * solarmass], masses))
+        
+    centerofmass(pos, v, masses)
+    
+    return adoptsystem(pos, v, masses)
+
+# This function generates Keplerian binaries with random orientations and orbital phases.
+# The mean anomalies are drawn uniformly and Kepler's equation is solved for all of the
+# binaries at once with Newton's method. The centers of mass of the binaries are spread
+# uniformly through a ball and are at rest.
+# @param count the number of binaries
+# @param primary the mass of each primary, a value or an array (in solar masses)
+# @param secondary the mass of each secondary, a value or an array (in solar masses)
+# @param semimajor the semimajor axis of each relative orbit, a value or an array (in meters)
+# @param eccentricity the eccentricity of each orbit, a value or an array (default 0)
+# @param spread the radius of the ball holding the binaries (in meters, default 0)
+# @param seed the seed of the random numbers (optional)
+# @return the StarSystem with the primary of binary k at row 2k and its secondary at 2k + 1
+#
+def keplerbinaries(count, primary, secondary, semimajor, eccentricity=0, spread=0, seed=None):
+    
+    rng = np.random.default_rng(seed)
+    
+    m1 = np.broadcast_to(np.asarray(primary, dtype=np.float64) * solarmass, (count,))
+    
+    m2 = np.broadcast_to(np.asarray(secondary, dtype=np.float64) * solarmass, (count,))
+    
+    a = np.broadcast_to(np.asarray(semimajor, dtype=np.float64), (count,))
+    
+    e = np.broadcast_to(np.asarray(eccentricity, dtype=np.float64), (count,))
+    
+    mean = rng.uniform(0, 2 * pi, count)
+    
+    anomaly = mean + e * np.sin(mean) #the eccentric anomaly, refined below
+    
+    for k in range(50):
+        
+        step = (anomaly - e * np.sin(anomaly) - mean) / (1 - e * np.cos(anomaly))
+        
+        anomaly -= step
+        
+        if(np.abs(step).max() < 1e-14):
+            
+            break
+        
+    mu = G * (m1 + m2)
+    
+    root = np.sqrt(1 - e * e)
+    
+    rate = np.sqrt(mu / a**3) / (1 - e * np.cos(anomaly)) #the rate of the eccentric anomaly
+    
+    # the relative orbit in its own plane, then turned to a random orientation
+    planar = np.stack((a * (np.cos(anomaly) - e), a * root * np.sin(anomaly)), axis=1)
+    
+    planarv = np.stack((-a * np.sin(anomaly) * rate, a * root * np.cos(anomaly) * rate), axis=1)
+    
+    normal = randomdirections(rng, count)
+    
+    helper = np.where(np.abs(normal[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+    
+    first = np.cross(normal, helper)
+    
+    first /= np.linalg.norm(first, axis=1)[:, np.newaxis]
+    
+    second = np.cross(normal, first)
+    
+    relative = planar[:, :1] * first + planar[:, 1:] * second
+    
+    relativev = planarv[:, :1] * first + planarv[:, 1:] * second
+    
+    centers = spread * rng.uniform(0, 1, count)[:, np.newaxis] ** (1/3) * randomdirections(rng, count)
+    
+    share = (m2 / (m1 + m2))[:, np.newaxis]
+    
+    pos = np.empty((2 * count, 3))
+    
+    v = np.empty((2 * count, 3))
+    
+    pos[0::2] = centers - share * relative
+    
+    pos[1::2] = centers + (1 - share) * relative
+    
+    v[0::2] = -share * relativev
+    
+    v[1::2] = (1 - share) * relativev
+    
+    masses = np.empty(2 * count)
+    
+    masses[0::2] = m1
+    
+    masses[1::2] = m2
+    
+    return adoptsystem(pos, v, masses)
+
+catalogfields = ("x", "y", "z", "vx", "vy", "vz", "mass") #the default record layout of a star catalog
+
+# This function loads a star catalog straight into the arrays of a new StarSystem. A
+# binary catalog (raw records of float fields, or a .npy file of shape N x fields) is
+# memory-mapped and converted in blocks of rows, so it is never held in memory twice.
+# A CSV catalog is parsed with numpy; if its first line is a header, the columns are
+# found by name. The units are converted in bulk: positions are multiplied by
+# lengthunit, velocities by velocityunit and masses by massunit, so the defaults read
+# meters, m/s and solar masses like Star.
+# @param path the path of the catalog
+# @param fields the names of the fields of each record, in order; "x", "y", "z", "vx",
+#        "vy", "vz" and "mass" must be present and any other field is ignored
+# @param dtype the float type of the fields of a raw binary catalog
+# @param lengthunit the length of a position unit of the catalog in meters (e.g. parsec)
+# @param velocityunit the speed of a velocity unit of the catalog in m/s (e.g. 1000 for km/s)
+# @param massunit the mass of a mass unit of the catalog in kg (default solarmass)
+# @param form "binary", "npy" or "csv", or None to choose from the extension
+# @param delimiter the delimiter of a CSV catalog
+# @param block the number of rows converted at a time
+# @return the StarSystem of the catalog
+#
+def loadcatalog(path, fields=catalogfields, dtype=np.float64, lengthunit=1.0, velocityunit=1.0, massunit=solarmass, form=None, delimiter=",", block=1 << 20):
+    
+    if(form is None):
+        
+        extension = os.path.splitext(path)[1].lower()
+        
+        form = {".csv": "csv", ".txt": "csv", ".npy": "npy"}.get(extension, "binary")
+        
+    fields = list(fields)
+    
+    if(form == "csv"):
         
-            totalsumdelx = 0
+        with open(path) as file:
+            
+            header = file.readline().strip().split(delimiter)
             
-            totalsumdely = 0
+        try:
             
-            totalsumdelz = 0
+            [float(value) for value in header]
             
-            pos1 = star1.getpos()
+            skip = 0
             
-            pos1x = pos1.getx()
+        except ValueError:
             
-            pos1y = pos1.gety()
+            fields = [name.strip() for name in header]
             
-            pos1z = pos1.getz()
+            skip = 1
+            
+        missing = [name for name in catalogfields if name not in fields]
         
-            for star2 in stars:
+        if(missing):
             
-                if(star1 != star2):
-                    
-                    pos2 = star2.getpos()
-                    
-                    pos2x = pos2.getx()
-                        
-                    pos2y = pos2.gety()
-                        
-                    pos2z = pos2.getz()
-                    
-                    if(magnitude(difference(pos1,pos2)) == 0):
-                        
-                        newvelocity1 = Vector(star1.getmass*pos1x,star1.getmass*pos1y,star1.getmass*pos1z)
-                        
-                        newvelocity2 = Vector(star2.getmass*pos2x,star2.getmass*pos2y,star2.getmass*pos2z)
-                        
-                        newv = addition(newvelocity1,newvelocity2)
-                        
-                        summass = star1.getmass + star2.getmass
-                        
-                        newv1 = Vector(newv.getx()/summass, newv.gety()/summass, newv.getz()/summass)
-                        
-                        star1.setvelocity(newv1)
-                        
-                        star1.setmass(star1.getmass()+star2.getmass())
-                        
-                        star2.setvelocity(Vector(0,0,0))
-                        
-                        star2.setmass(0)
-                    
-                    else:
-                        
-                        totalsumdelx += (star2.getmass() * G * (pos1x-pos2x) * delt)/(magnitude(difference(pos1, pos2)) ** 3)
-                    
-                        totalsumdely += (star2.getmass() * G * (pos1y-pos2y) * delt)/(magnitude(difference(pos1, pos2)) ** 3)
-                    
-                        totalsumdelz += (star2.getmass() * G * (pos1z-pos2z) * delt)/(magnitude(difference(pos1, pos2)) ** 3)
+            raise ValueError("the catalog has no %s column" % ", ".join(missing))
+        
+        records = np.loadtxt(path, delimiter=delimiter, skiprows=skip, usecols=[fields.index(name) for name in catalogfields], ndmin=2)
+        
+        fields = list(catalogfields)
+        
+    elif(form == "npy"):
+        
+        records = np.load(path, mmap_mode='r')
+        
+    elif(form == "binary"):
+        
+        records = np.memmap(path, dtype=dtype, mode='r')
+        
+        records = records.reshape(-1, len(fields))
+        
+    else:
+        
+        raise ValueError("unknown catalog form %r, expected 'binary', 'npy' or 'csv'" % form)
+    
+    missing = [name for name in catalogfields if name not in fields]
+    
+    if(missing):
+        
+        raise ValueError("the record layout has no %s field" % ", ".join(missing))
+    
+    where = [fields.index(name) for name in catalogfields]
+    
+    n = len(records)
+    
+    pos = np.empty((n,3))
+    
+    v = np.empty((n,3))
+    
+    mass = np.empty(n)
+    
+    for start in range(0, n, block):
+        
+        stop = min(start + block, n)
+        
+        rows = records[start:stop]
+        
+        pos[start:stop] = rows[:, where[0:3]] * lengthunit
+        
+        v[start:stop] = rows[:, where[3:6]] * velocityunit
+        
+        mass[start:stop] = rows[:, where[6]] * massunit
+        
+    return adoptsystem(pos, v, mass)
+
+# This function calculates the gravitational acceleration of every body due to every
+# other body (equations 11 and 12 in the design document divided by delt) in one
+# broadcast pass over all of the pairs. The target bodies are processed in tiles so
+# that at most maxpairs separations are held in memory at once. Pairs that are
+# separated by a distance of zero (including each body with itself) are skipped.
+# Only the target bodies first through last - 1 are computed when a range is given.
+# If a potential array is given, the gravitational potential of each target body is
+# also filled in from the same pairwise distances. With a softening length eps the
+# Plummer-softened force G m d / (r^2 + eps^2)^(3/2) is used. With the "single"
+# precision the pairwise pass is done by mixedaccelerations instead.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param tile the number of target bodies per tile, or None to choose it from maxpairs
+# @param first the first target body (optional)
+# @param last one past the last target body, or None for all of the bodies (optional)
+# @param potential an array of (last - first) values to store the potential in (optional)
+# @param softening the Plummer softening length eps (optional)
+# @param precision "double" for the float64 pass or "single" for the mixed float32 pass
+# @return a (last - first) x 3 array with the acceleration of each target body
+#
+def accelerations(pos, mass, tile=None, first=0, last=None, potential=None, softening=0, precision="double"):
+    
+    if(precision == "single"):
+        
+        return mixedaccelerations(pos, mass, tile, first, last, potential, softening)
+    
+    if(precision != "double"):
+        
+        raise ValueError("unknown precision %r, expected 'double' or 'single'" % precision)
+    
+    n = len(mass)
+    
+    if(last is None):
+        
+        last = n
+    
+    acc = np.zeros((last - first,3))
+    
+    if(tile is None):
+        
+        tile = max(1, maxpairs // max(n,1))
+    
+    for start in range(first, last, tile):
+        
+        stop = min(start + tile, last)
+        
+        diff = pos[start:stop, np.newaxis, :] - pos[np.newaxis, :, :] #r_i - r_j for every pair
+        
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        
+        invr3 = np.zeros_like(r2)
+        
+        nonzero = r2 > 0
+        
+        invr3[nonzero] = (r2[nonzero] + softening * softening) ** -1.5
+        
+        acc[start-first:stop-first] = -G * np.einsum('ij,ijk->ik', invr3 * mass, diff)
+        
+        if(potential is not None):
+            
+            potential[start-first:stop-first] = -G * (((r2 + softening * softening) * invr3) @ mass) #r^2 / r^3 = 1 / r
+        
+    return acc
+
+# This function calculates the same accelerations as accelerations, but does the pairwise
+# pass in float32 to halve the memory traffic of the kernel. The positions are centered
+# and scaled by the size of the system and the masses by the largest mass, so the float32
+# values stay far from overflow and underflow, and the separations are taken per component
+# on blocks of source bodies. Each block is summed in float32 and the blocks are added up
+# in float64, and the master state in pos and mass is never changed. The relative error of
+# each acceleration is about 1e-7, and bodies closer than about 1e-7 of the size of the
+# system are treated as coincident.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param tile the number of target bodies per tile, or None for 256
+# @param first the first target body (optional)
+# @param last one past the last target body, or None for all of the bodies (optional)
+# @param potential an array of (last - first) values to store the potential in (optional)
+# @param softening the Plummer softening length eps (optional)
+# @param block the number of source bodies per float32 partial sum
+# @return a (last - first) x 3 array with the acceleration of each target body
+#
+def mixedaccelerations(pos, mass, tile=None, first=0, last=None, potential=None, softening=0, block=4096):
+    
+    n = len(mass)
+    
+    if(last is None):
+        
+        last = n
+    
+    acc = np.zeros((last - first,3))
+    
+    if(n == 0):
+        
+        return acc
+    
+    if(tile is None):
+        
+        tile = 256
+        
+    if(potential is not None):
+        
+        potential[:] = 0
+        
+    center = pos.mean(axis=0)
+    
+    length = np.abs(pos - center).max() or 1.0
+    
+    scale = np.abs(mass).max() or 1.0
+    
+    coords = ((pos - center) / length).T.astype(np.float32) #3 x N, one row per component
+    
+    weights = (mass / scale).astype(np.float32)
+    
+    eps2 = np.float32((softening / length) ** 2)
+    
+    for start in range(first, last, tile):
+        
+        stop = min(start + tile, last)
+        
+        for source in range(0, n, block):
+            
+            end = min(source + block, n)
+            
+            diffs = [coords[k, start:stop, np.newaxis] - coords[k, np.newaxis, source:end] for k in range(3)]
+            
+            r2 = diffs[0] * diffs[0]
+            
+            r2 += diffs[1] * diffs[1]
+            
+            r2 += diffs[2] * diffs[2]
+            
+            coincident = r2 == 0
+            
+            r2 += eps2
+            
+            r2[coincident] = np.inf #skips each body with itself
+            
+            if(potential is not None):
+                
+                potential[start-first:stop-first] -= (r2 ** np.float32(-0.5) @ weights[source:end]).astype(np.float64)
+                
+            strength = r2 ** np.float32(-1.5)
+            
+            strength *= weights[source:end]
+            
+            for k in range(3):
+                
+                diffs[k] *= strength
+                
+                acc[start-first:stop-first, k] -= diffs[k].sum(axis=1)
+                
+    if(potential is not None):
+        
+        potential[:] *= G * scale / length
+        
+    acc *= G * scale / length**2
+    
+    return acc
+
+# This function finds the pairs of bodies that are closer than the merge radius using a
+# uniform spatial hash: every body is hashed to a cubic cell with a side of one radius,
+# the bodies are sorted by cell, and only the bodies in each cell and in half of its 26
+# neighbors (the other half finds the same pairs from the other side) are compared,
+# which takes roughly O(N) time. The neighbors are looked up once per occupied cell,
+# in a table of the cells when the occupied box is small enough and otherwise by a
+# search of the sorted cell keys.
+# @param pos an N x 3 array of positions
+# @param radius the merge radius (greater than zero)
+# @return a tuple of two arrays (i, j) with i < j for every pair closer than the radius
+#
+def closepairs(pos, radius):
+    
+    n = len(pos)
+    
+    if(n == 0):
+        
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    
+    cells = np.floor(pos / radius).astype(np.int64)
+    
+    cells -= cells.min(axis=0) - 1 #every cell and its lower neighbors have positive coordinates
+    
+    mask = (1 << 21) - 1
+    
+    wraps = cells.max() >= mask - 1 #a hash collision can list a pair twice
+    
+    keys = ((cells[:,0] & mask) << 42) | ((cells[:,1] & mask) << 21) | (cells[:,2] & mask)
+    
+    order = np.argsort(keys, kind='stable')
+    
+    unique, first, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    
+    cellcoords = cells[order[first]] #the coordinates of each occupied cell
+    
+    cellofsorted = np.repeat(np.arange(len(unique)), counts) #the cell of each body in sorted order
+    
+    dims = cells.max(axis=0) + 2
+    
+    table = None
+    
+    if(not wraps and dims.prod() <= 8 * n):
+        
+        table = np.full(dims.prod(), -1, dtype=np.int64)
+        
+        table[(cellcoords[:,0] * dims[1] + cellcoords[:,1]) * dims[2] + cellcoords[:,2]] = np.arange(len(unique))
+        
+    lefts = []
+    
+    rights = []
+    
+    for dx in (-1, 0, 1):
+        
+        for dy in (-1, 0, 1):
+            
+            for dz in (-1, 0, 1):
+                
+                if((dx, dy, dz) < (0, 0, 0)):
                     
+                    continue
+                
+                shifted = cellcoords + (dx, dy, dz)
                 
-            vx0 = star1.getvelocity().getx()
+                if(table is not None):
                     
-            vy0 = star1.getvelocity().gety()
+                    found = table[(shifted[:,0] * dims[1] + shifted[:,1]) * dims[2] + shifted[:,2]]
                     
-            vz0 = star1.getvelocity().getz()
-            
-            #print(totalsumdelx,totalsumdely,totalsumdelz)
+                    present = found >= 0
+                    
+                else:
+                    
+                    neighbor = ((shifted[:,0] & mask) << 42) | ((shifted[:,1] & mask) << 21) | (shifted[:,2] & mask)
+                    
+                    # the neighbor keys keep the order of the cells unless the hash wraps, and
+                    # the search is much faster for sorted keys
+                    sort = np.argsort(neighbor, kind='stable') if wraps else slice(None)
+                    
+                    found = np.empty(len(unique), dtype=np.int64)
+                    
+                    found[sort] = np.minimum(np.searchsorted(unique, neighbor[sort]), len(unique) - 1)
+                    
+                    present = unique[found] == neighbor
+                    
+                withneighbor = present[cellofsorted]
+                
+                bodies = order[withneighbor]
+                
+                other = found[cellofsorted[withneighbor]]
+                
+                number = counts[other]
+                
+                # pair each body with every body of its neighboring cell
+                left = np.repeat(bodies, number)
+                
+                right = order[np.repeat(first[other] - np.cumsum(number) + number, number) + np.arange(number.sum())]
+                
+                if(dx == 0 and dy == 0 and dz == 0):
                     
-            v1 = Vector(vx0 - totalsumdelx, vy0 - totalsumdely, vz0 - totalsumdelz)
+                    keep = left < right
                     
-            star1.setvelocity(v1)
+                    left = left[keep]
                     
-        for star in stars:
+                    right = right[keep]
+                    
+                diff = pos[left] - pos[right]
+                
+                close = np.einsum('ij,ij->i', diff, diff) < radius * radius
+                
+                lefts.append(np.minimum(left[close], right[close]))
+                
+                rights.append(np.maximum(left[close], right[close]))
+                
+    left = np.concatenate(lefts)
+    
+    right = np.concatenate(rights)
+    
+    if(wraps and len(left) > 0):
+        
+        pairs = np.unique(left * n + right)
+        
+        left = pairs // n
+        
+        right = pairs % n
+        
+    return left, right
+
+# This function merges every group of bodies in the system that are within the merge
+# radius of each other (or, for a radius of zero, that occupy exactly the same position).
+# Groups are found with closepairs and joined transitively. Each group is merged into its
+# first body, which receives the total mass, the momentum-conserving velocity and (for a
+# nonzero radius) the center of mass of the group. The absorbed bodies are then removed
+# from the arrays so that they are no longer carried through the force loops; their Star
+# views are detached and keep their last position with zero mass and zero velocity.
+# When compact is false the absorbed bodies are kept with zero mass and zero velocity,
+# and since only bodies with mass take part in the search they are not merged again.
+# The accelerations kept by the integrators are only discarded when bodies merged.
+# @param system the StarSystem to check for mergers
+# @param radius the merge radius (0 for exact coincidence)
+# @param compact whether to remove the absorbed bodies from the arrays
+# @return the number of bodies that were absorbed
+#
+def mergeclose(system, radius=0, compact=True):
+    
+    n = len(system)
+    
+    live = np.nonzero(system.mass > 0)[0] #bodies absorbed earlier have zero mass and never merge again
+    
+    if(len(live) < 2):
+        
+        return 0
+    
+    label = np.arange(n)
+    
+    if(radius > 0):
+        
+        left, right = closepairs(system.pos[live], radius)
+        
+        if(len(left) == 0):
+            
+            return 0
+        
+        left = live[left]
+        
+        right = live[right]
+        
+        while(True):
+            
+            joined = np.minimum(label[left], label[right])
+            
+            previous = label.copy()
+            
+            np.minimum.at(label, left, joined)
+            
+            np.minimum.at(label, right, joined)
+            
+            label = label[label]
+            
+            if(np.array_equal(label, previous)):
+                
+                break
+            
+    else:
+        
+        unique, first, inverse = np.unique(system.pos[live], axis=0, return_index=True, return_inverse=True)
+        
+        if(len(unique) == len(live)):
+            
+            return 0
+        
+        label[live] = live[first[inverse.reshape(-1)]]
+        
+    absorbed = label != np.arange(n)
+    
+    if(not absorbed.any()):
+        
+        return 0
+    
+    summass = np.bincount(label, weights=system.mass, minlength=n)
+    
+    survivors = np.nonzero(~absorbed & (np.bincount(label, minlength=n) > 1))[0]
+    
+    momentum = np.stack([np.bincount(label, weights=system.mass * system.v[:,k], minlength=n) for k in range(3)], axis=1)
+    
+    moment = np.stack([np.bincount(label, weights=system.mass * system.pos[:,k], minlength=n) for k in range(3)], axis=1)
+    
+    massive = survivors[summass[survivors] > 0]
+    
+    system.v[massive] = momentum[massive] / summass[massive, np.newaxis]
+    
+    if(radius > 0):
+        
+        system.pos[massive] = moment[massive] / summass[massive, np.newaxis]
+        
+    system.mass[survivors] = summass[survivors]
+    
+    system.v[absorbed] = 0
+    
+    system.mass[absorbed] = 0
+    
+    system.acc = None
+    
+    system.level = None
+    
+    if(compact):
+        
+        keep = np.nonzero(~absorbed)[0]
+        
+        newindex = np.full(n, -1)
+        
+        newindex[keep] = np.arange(len(keep))
+        
+        bound = {}
+        
+        for star in system.stars.values():
+            
+            if(absorbed[star.index]):
+                
+                row = system.pos[star.index]
+                
+                star.system = None
+                
+                star.pos = Vector(row[0], row[1], row[2])
+                
+                star.v = Vector(0, 0, 0)
+                
+                star.mass = 0
+                
+            else:
+                
+                star.index = int(newindex[star.index])
+                
+                bound[star.index] = star
+                
+        system.stars = bound
+        
+        system.pos = system.pos[keep]
+        
+        system.v = system.v[keep]
+        
+        system.mass = system.mass[keep]
+        
+    return int(absorbed.sum())
+
+# This class defines the methods and initializes the variables for an Octree object.
+# An object of the class Octree recursively divides a cube around a set of bodies into
+# eight octants until every leaf holds at most leafsize bodies, and stores the total mass
+# and center of mass of every node. The nodes are stored in flat lists indexed by node
+# number, and the bodies of every node are a contiguous slice of the array order.
+#
+class Octree:
+    
+    # Constructor builds the tree over the given bodies upon
+    # instantiation of the object.
+    # @param self the bound version of this object
+    # @param pos an N x 3 array of positions
+    # @param mass an array of N masses
+    # @param leafsize the largest number of bodies stored in a leaf
+    def __init__(self, pos, mass, leafsize=8):
+        
+        self.center = [] #the center of the cube of each node
+        
+        self.half = [] #half of the side length of the cube of each node
+        
+        self.mass = [] #the total mass in each node
+        
+        self.com = [] #the center of mass of each node
+        
+        self.start = [] #the first index into order of the bodies in each node
+        
+        self.count = [] #the number of bodies in each node
+        
+        self.children = [] #the node numbers of the children of each node (empty for a leaf)
+        
+        self.depth = [] #the number of levels between each node and the root
+        
+        self.order = np.arange(len(mass))
+        
+        self.leafsize = leafsize
+        
+        if(len(mass) == 0):
+            
+            return
+        
+        low = pos.min(axis=0)
+        
+        high = pos.max(axis=0)
+        
+        center = (low + high) / 2
+        
+        half = max((high - low).max() / 2, 1e-300) * (1 + 1e-12)
+        
+        stack = [(self.addnode(center, half, pos, mass, 0, len(mass), 0), 0)]
+        
+        while(len(stack) > 0):
             
-            x0 = star.getpos().getx()
+            node, depth = stack.pop()
             
-            y0 = star.getpos().gety()
+            start = self.start[node]
             
-            z0 = star.getpos().getz()
+            count = self.count[node]
             
-            x1 = x0 + star.getvelocity().getx() * delt
+            if(count <= leafsize or depth >= 64):
+                
+                continue
             
-            y1 = y0 + star.getvelocity().gety() * delt
+            members = self.order[start:start+count]
             
-            z1 = z0 + star.getvelocity().getz() * delt
+            above = pos[members] >= self.center[node]
             
-            #print(x1,y1,z1)
+            octant = above[:,0] * 4 + above[:,1] * 2 + above[:,2]
             
-            r1 = Vector(x1,y1,z1)
+            sort = np.argsort(octant, kind='stable')
             
-            star.setpos(r1)
+            self.order[start:start+count] = members[sort]
             
-            #print(star.getpos().getx())
+            bounds = np.searchsorted(octant[sort], np.arange(9))
             
-        counter += delt
+            childhalf = self.half[node] / 2
+            
+            for k in range(8):
+                
+                if(bounds[k+1] > bounds[k]):
+                    
+                    sign = np.array([(k >> 2) & 1, (k >> 1) & 1, k & 1]) * 2 - 1
+                    
+                    child = self.addnode(self.center[node] + sign * childhalf, childhalf, pos, mass, start + bounds[k], bounds[k+1] - bounds[k], depth + 1)
+                    
+                    self.children[node].append(child)
+                    
+                    stack.append((child, depth + 1))
+    
+    # This function appends a node with the given cube and bodies to the tree,
+    # computing its total mass and center of mass.
+    # @param self the bound version of this object
+    # @param center the center of the cube of the node
+    # @param half half of the side length of the cube of the node
+    # @param pos an N x 3 array of positions
+    # @param mass an array of N masses
+    # @param start the first index into order of the bodies in the node
+    # @param count the number of bodies in the node
+    # @param depth the number of levels between the node and the root
+    # @return the number of the new node
+    def addnode(self, center, half, pos, mass, start, count, depth):
+        
+        members = self.order[start:start+count]
+        
+        total = mass[members].sum()
+        
+        if(total > 0):
+            
+            com = (mass[members, np.newaxis] * pos[members]).sum(axis=0) / total
+            
+        else:
+            
+            com = center
+        
+        self.center.append(center)
+        
+        self.half.append(half)
+        
+        self.mass.append(total)
+        
+        self.com.append(com)
+        
+        self.start.append(start)
+        
+        self.count.append(count)
+        
+        self.children.append([])
+        
+        self.depth.append(depth)
+        
+        return len(self.mass) - 1
+    
+    # This function returns the indices of the bodies in the given node
+    # @param self the bound version of this object
+    # @param node the number of the node
+    # @return an array with the indices of the bodies in the node
+    def members(self, node):
+        
+        return self.order[self.start[node]:self.start[node]+self.count[node]]
+
+# This function walks an Octree of the bodies once from the root with the whole set of
+# bodies as targets, for a pairwise force f(r) = weight(r^2) r. At each node, the targets
+# for which the node appears smaller than the opening angle theta (side length /
+# distance < theta) are attracted by the total mass of the node at its center of mass,
+# and the remaining targets are passed on to the children of the node, or summed
+# directly at a leaf, where a body never attracts itself. A node is always opened for
+# the targets inside its cube. For a force that vanishes
+# below an exclusion radius, a node is dropped for the targets that are closer than
+# that to every point of its cube, and the leaf pairs closer than that are skipped.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param theta the opening angle (0 reproduces the direct sum)
+# @param leafsize the largest number of bodies stored in a leaf of the tree
+# @param weight the function that returns the force per unit mass and separation for an
+#        array of positive squared distances
+# @param exclude the distance below which the force vanishes (default 0)
+# @return an N x 3 array with the acceleration of each body
+#
+def treeaccelerations(pos, mass, theta, leafsize, weight, exclude=0):
+    
+    n = len(mass)
+    
+    acc = np.zeros((n,3))
+    
+    tree = Octree(pos, mass, leafsize)
+    
+    if(n == 0):
+        
+        return acc
+    
+    stack = [(0, np.arange(n))]
+    
+    while(len(stack) > 0):
+        
+        node, targets = stack.pop()
+        
+        if(tree.mass[node] == 0):
+            
+            continue
+        
+        diff = tree.com[node] - pos[targets]
+        
+        r2 = np.einsum('ij,ij->i', diff, diff)
+        
+        far = (2 * tree.half[node]) ** 2 < theta * theta * r2
+        
+        # above theta = 1 / sqrt(3) a node can pass the test for a target inside its own
+        # cube, whose mass it holds, so such nodes are always opened
+        if(theta * math.sqrt(3) > 1 and far.any()):
+            
+            far &= (np.abs(pos[targets] - tree.center[node]) > tree.half[node]).any(axis=1)
+            
+        # no point of the cube is farther than its diagonal from the center of mass
+        reach = exclude - 2 * math.sqrt(3) * tree.half[node]
+        
+        if(reach > 0):
+            
+            inside = r2 < reach * reach
+            
+            targets, diff, r2, far = targets[~inside], diff[~inside], r2[~inside], far[~inside]
+            
+        if(far.any()):
+            
+            acc[targets[far]] += G * tree.mass[node] * diff[far] * weight(r2[far])[:, np.newaxis]
+            
+        near = targets[~far]
+        
+        if(len(near) == 0):
+            
+            continue
+        
+        if(len(tree.children[node]) == 0):
+            
+            members = tree.members(node)
+            
+            diff = pos[members][np.newaxis, :, :] - pos[near][:, np.newaxis, :]
+            
+            r2 = np.einsum('ijk,ijk->ij', diff, diff)
+            
+            factor = np.zeros_like(r2)
+            
+            nonzero = (r2 > 0) & (r2 >= exclude * exclude)
+            
+            factor[nonzero] = weight(r2[nonzero])
+            
+            acc[near] += G * np.einsum('ij,ijk->ik', factor * mass[members], diff)
+            
+        else:
+            
+            for child in tree.children[node]:
+                
+                stack.append((child, near))
+                
+    return acc
+
+# This function calculates the gravitational acceleration of every body using the
+# Barnes-Hut approximation, a walk of an Octree of the bodies with the Newtonian force.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param theta the opening angle (0 reproduces the direct sum)
+# @param leafsize the largest number of bodies stored in a leaf of the tree
+# @return an N x 3 array with the acceleration of each body
+#
+def barneshut(pos, mass, theta=0.5, leafsize=8):
+    
+    return treeaccelerations(pos, mass, theta, leafsize, lambda r2: r2 ** -1.5)
+
+# This class defines the methods and initializes the variables for a Multiindex object.
+# An object of the class Multiindex enumerates every Cartesian multi-index (nx,ny,nz)
+# up to a given total order in graded order and holds the index tables used by the
+# fast multipole method to shift and convert expansions of that order with array
+# operations instead of loops over terms.
+#
+class Multiindex:
+    
+    # Constructor builds the index tables upon instantiation of the object.
+    # @param self the bound version of this object
+    # @param order the expansion order p (derivatives of 1/r are needed up to 2p)
+    def __init__(self, order):
+        
+        self.order = order
+        
+        self.terms = [] #every multi-index up to order 2p, in graded order
+        
+        for q in range(2 * order + 1):
+            
+            for nx in range(q, -1, -1):
+                
+                for ny in range(q - nx, -1, -1):
+                    
+                    self.terms.append((nx, ny, q - nx - ny))
+                    
+        self.index = {term: i for i, term in enumerate(self.terms)}
+        
+        self.count = (order + 1) * (order + 2) * (order + 3) // 6 #number of terms up to order p
+        
+        self.powers = np.array(self.terms) #(terms, 3) exponents
+        
+        low = self.terms[:self.count]
+        
+        binom = [[math.comb(a[0], b[0]) * math.comb(a[1], b[1]) * math.comb(a[2], b[2]) for b in low] for a in low]
+        
+        # sumindex[a,b] is the index of a+b; m2lcoef[a,b] is C(a+b,a)(-1)^|b|
+        self.sumindex = np.array([[self.index[(a[0]+b[0], a[1]+b[1], a[2]+b[2])] for b in low] for a in low])
+        
+        self.m2lcoef = np.array([[math.comb(a[0]+b[0], a[0]) * math.comb(a[1]+b[1], a[1]) * math.comb(a[2]+b[2], a[2]) * (-1) ** sum(b) for b in low] for a in low], dtype=np.float64)
+        
+        # diffindex[a,b] is the index of a-b where b <= a (0 elsewhere); shiftcoef[a,b] is C(a,b) there and 0 elsewhere
+        self.diffindex = np.array([[self.index[(a[0]-b[0], a[1]-b[1], a[2]-b[2])] if min(a[0]-b[0], a[1]-b[1], a[2]-b[2]) >= 0 else 0 for b in low] for a in low])
+        
+        self.shiftcoef = np.array([[binom[i][j] if min(a[0]-b[0], a[1]-b[1], a[2]-b[2]) >= 0 else 0 for j, b in enumerate(low)] for i, a in enumerate(low)], dtype=np.float64)
+        
+        # the gradient of the local expansion: d/dx_k u^a = a_k u^(a-e_k)
+        self.gradindex = np.zeros((3, self.count), dtype=int)
+        
+        self.gradcoef = np.zeros((3, self.count))
+        
+        for i, a in enumerate(low):
+            
+            for k in range(3):
+                
+                if(a[k] > 0):
+                    
+                    lower = list(a)
+                    
+                    lower[k] -= 1
+                    
+                    self.gradindex[k, i] = self.index[tuple(lower)]
+                    
+                    self.gradcoef[k, i] = a[k]
+    
+    # This function returns the monomials w^b of each row of the given vectors
+    # for every multi-index b up to the given order.
+    # @param self the bound version of this object
+    # @param w a K x 3 array of vectors
+    # @param count the number of terms to return (self.count for order p)
+    # @return a K x count array with the monomials of each vector
+    def monomials(self, w, count):
+        
+        exponents = self.powers[:count]
+        
+        top = exponents.max()
+        
+        power = np.ones((len(w), 3, top + 1))
+        
+        for k in range(1, top + 1):
+            
+            power[:, :, k] = power[:, :, k-1] * w
+            
+        return power[:, 0, exponents[:,0]] * power[:, 1, exponents[:,1]] * power[:, 2, exponents[:,2]]
+    
+    # This function returns the Taylor coefficients D^k(1/r)/k! of 1/|R| for every
+    # multi-index k up to order 2p, using the recurrence
+    # |k| r^2 T_k + (2|k|-1) sum_i R_i T_(k-e_i) + (|k|-1) sum_i T_(k-2e_i) = 0.
+    # @param self the bound version of this object
+    # @param R a K x 3 array of separations
+    # @return a K x terms array with the coefficients of each separation
+    def taylor(self, R):
+        
+        r2 = np.einsum('ij,ij->i', R, R)
+        
+        T = np.zeros((len(R), len(self.terms)))
+        
+        T[:, 0] = 1 / np.sqrt(r2)
+        
+        for i in range(1, len(self.terms)):
+            
+            k = self.terms[i]
+            
+            q = sum(k)
+            
+            total = np.zeros(len(R))
+            
+            for axis in range(3):
+                
+                if(k[axis] >= 1):
+                    
+                    lower = list(k)
+                    
+                    lower[axis] -= 1
+                    
+                    total += (2 * q - 1) * R[:, axis] * T[:, self.index[tuple(lower)]]
+                    
+                if(k[axis] >= 2):
+                    
+                    lower = list(k)
+                    
+                    lower[axis] -= 2
+                    
+                    total += (q - 1) * T[:, self.index[tuple(lower)]]
+                    
+            T[:, i] = -total / (q * r2)
+            
+        return T
+
+multiindices = {} #Multiindex tables cached by expansion order
+
+# This function adds the time elapsed since start to the given phase of a timings
+# dictionary (if one was given) and returns the current time.
+# @param timings a dictionary from phase name to seconds, or None
+# @param phase the name of the phase
+# @param start the perf_counter time the phase started
+# @return the current perf_counter time
+#
+def addtiming(timings, phase, start):
+    
+    now = timer.perf_counter()
+    
+    if(timings is not None):
+        
+        timings[phase] = timings.get(phase, 0.0) + now - start
+        
+    return now
+
+# This function calculates the gravitational acceleration of every body with the fast
+# multipole method, using Cartesian Taylor expansions of the given order on the adaptive
+# Octree. Multipole expansions are formed at the leaves and shifted up the tree (upward
+# pass), converted into local expansions between well-separated pairs of nodes found by
+# a dual tree walk (M2L), shifted down the tree and evaluated at the bodies (downward
+# pass), and the remaining pairs of neighboring leaves are summed directly (P2P).
+# Two nodes are well separated when the sum of their radii is less than theta times
+# the distance between their centers; the error falls off roughly as theta^(order+1).
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param order the expansion order p
+# @param theta the separation ratio of the multipole acceptance criterion (below 1)
+# @param leafsize the largest number of bodies stored in a leaf of the tree
+# @param timings a dictionary that the seconds spent in each of the phases "tree",
+#        "upward", "m2l", "downward" and "p2p" are added to (optional)
+# @return an N x 3 array with the acceleration of each body
+#
+def fmm(pos, mass, order=4, theta=0.5, leafsize=32, timings=None):
+    
+    n = len(mass)
+    
+    acc = np.zeros((n,3))
+    
+    if(n == 0):
+        
+        return acc
+    
+    if(order not in multiindices):
+        
+        multiindices[order] = Multiindex(order)
+        
+    table = multiindices[order]
+    
+    count = table.count
+    
+    start = timer.perf_counter()
+    
+    tree = Octree(pos, mass, leafsize)
+    
+    nodes = len(tree.mass)
+    
+    center = np.array(tree.center)
+    
+    depth = np.array(tree.depth)
+    
+    children = np.full((nodes, 8), -1)
+    
+    parent = np.full(nodes, -1)
+    
+    for node in range(nodes):
+        
+        kids = tree.children[node]
+        
+        children[node, :len(kids)] = kids
+        
+        parent[kids] = node
+        
+    leaf = children[:, 0] < 0
+    
+    leaves = np.nonzero(leaf)[0]
+    
+    leaves = leaves[np.argsort(np.array(tree.start)[leaves])]
+    
+    starts = np.array(tree.start)[leaves]
+    
+    bodyleaf = np.repeat(leaves, np.array(tree.count)[leaves]) #the leaf of each body in tree order
+    
+    sortedpos = pos[tree.order]
+    
+    radius = np.zeros(nodes)
+    
+    offsets = sortedpos - center[bodyleaf]
+    
+    radius[leaves] = np.maximum.reduceat(np.sqrt(np.einsum('ij,ij->i', offsets, offsets)), starts)
+    
+    for level in range(depth.max(), 0, -1):
+        
+        nodesatlevel = np.nonzero(depth == level)[0]
+        
+        reach = radius[nodesatlevel] + np.sqrt(np.einsum('ij,ij->i', center[nodesatlevel] - center[parent[nodesatlevel]], center[nodesatlevel] - center[parent[nodesatlevel]]))
+        
+        np.maximum.at(radius, parent[nodesatlevel], reach)
+        
+    start = addtiming(timings, "tree", start)
+    
+    # upward pass: P2M at the leaves, then M2M from the deepest level to the root
+    
+    multipole = np.zeros((nodes, count))
+    
+    multipole[leaves] = np.add.reduceat(mass[tree.order][:, np.newaxis] * table.monomials(offsets, count), starts)
+    
+    for level in range(depth.max(), 0, -1):
+        
+        kids = np.nonzero(depth == level)[0]
+        
+        shift = table.monomials(center[kids] - center[parent[kids]], count)[:, table.diffindex] * table.shiftcoef
+        
+        np.add.at(multipole, parent[kids], np.einsum('kba,ka->kb', shift, multipole[kids]))
+        
+    start = addtiming(timings, "upward", start)
+    
+    # dual tree walk: split the pair list into well-separated (M2L) and neighboring leaf (P2P) pairs
+    
+    targets = np.zeros(1, dtype=int)
+    
+    sources = np.zeros(1, dtype=int)
+    
+    m2lpairs = []
+    
+    p2ppairs = []
+    
+    while(len(targets) > 0):
+        
+        separation = center[targets] - center[sources]
+        
+        distance = np.sqrt(np.einsum('ij,ij->i', separation, separation))
+        
+        accept = radius[targets] + radius[sources] < theta * distance
+        
+        m2lpairs.append((targets[accept], sources[accept]))
+        
+        targets = targets[~accept]
+        
+        sources = sources[~accept]
+        
+        bothleaves = leaf[targets] & leaf[sources]
+        
+        p2ppairs.append((targets[bothleaves], sources[bothleaves]))
+        
+        targets = targets[~bothleaves]
+        
+        sources = sources[~bothleaves]
+        
+        splittarget = ~leaf[targets] & (leaf[sources] | (radius[targets] >= radius[sources]))
+        
+        newtargets = children[targets[splittarget]]
+        
+        newsources = np.repeat(sources[splittarget, np.newaxis], 8, axis=1)
+        
+        othertargets = np.repeat(targets[~splittarget, np.newaxis], 8, axis=1)
+        
+        othersources = children[sources[~splittarget]]
+        
+        targets = np.concatenate((newtargets.reshape(-1), othertargets.reshape(-1)))
+        
+        sources = np.concatenate((newsources.reshape(-1), othersources.reshape(-1)))
+        
+        valid = (targets >= 0) & (sources >= 0)
+        
+        targets = targets[valid]
+        
+        sources = sources[valid]
+        
+    start = addtiming(timings, "tree", start)
+    
+    # M2L: convert the multipole of each source into a local expansion about each target.
+    # Separations repeat between the cells of a level, so the translation operator is
+    # built once per distinct separation and applied to all of its pairs as one product.
+    
+    local = np.zeros((nodes, count))
+    
+    targets = np.concatenate([pair[0] for pair in m2lpairs])
+    
+    sources = np.concatenate([pair[1] for pair in m2lpairs])
+    
+    if(len(targets) > 0):
+        
+        separation = center[targets] - center[sources]
+        
+        unit = tree.half[0] / 2 ** depth.max() #every separation of cell centers is a multiple of this
+        
+        if(depth.max() < 19):
+            
+            steps = np.rint(separation / unit).astype(np.int64) + (1 << 20)
+            
+            keys, first, inverse = np.unique((steps[:,0] << 42) | (steps[:,1] << 21) | steps[:,2], return_index=True, return_inverse=True)
+            
+            separations = separation[first]
+            
+        else:
+            
+            separations, inverse = np.unique(separation, axis=0, return_inverse=True)
+        
+        inverse = inverse.reshape(-1)
+        
+        T = table.taylor(separations)
+        
+        sort = np.argsort(inverse, kind='stable')
+        
+        bounds = np.searchsorted(inverse[sort], np.arange(len(separations) + 1))
+        
+        for u in range(len(separations)):
+            
+            group = sort[bounds[u]:bounds[u+1]]
+            
+            operator = T[u, table.sumindex] * table.m2lcoef
+            
+            local[targets[group]] += multipole[sources[group]] @ operator.T
+        
+    start = addtiming(timings, "m2l", start)
+    
+    # downward pass: L2L from the root to the leaves, then L2P at the bodies
+    
+    for level in range(1, depth.max() + 1):
+        
+        kids = np.nonzero(depth == level)[0]
+        
+        shift = table.monomials(center[kids] - center[parent[kids]], count)[:, table.diffindex] * table.shiftcoef
+        
+        local[kids] += np.einsum('kae,ka->ke', shift, local[parent[kids]])
+        
+    mono = table.monomials(offsets, count)
+    
+    bodylocal = local[bodyleaf]
+    
+    for k in range(3):
+        
+        acc[tree.order, k] = G * np.einsum('ij,ij->i', bodylocal * table.gradcoef[k], mono[:, table.gradindex[k]])
+        
+    start = addtiming(timings, "downward", start)
+    
+    # P2P: sum the neighboring leaves of each target leaf directly
+    
+    targets = np.concatenate([pair[0] for pair in p2ppairs])
+    
+    sources = np.concatenate([pair[1] for pair in p2ppairs])
+    
+    sort = np.argsort(targets, kind='stable')
+    
+    targets = targets[sort]
+    
+    sources = sources[sort]
+    
+    bounds = np.nonzero(np.diff(targets))[0] + 1
+    
+    nodestart = np.array(tree.start)
+    
+    nodecount = np.array(tree.count)
+    
+    for group in np.split(np.arange(len(targets)), bounds):
+        
+        if(len(group) == 0):
+            
+            continue
+        
+        near = tree.members(targets[group[0]])
+        
+        counts = nodecount[sources[group]]
+        
+        members = tree.order[np.repeat(nodestart[sources[group]] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        
+        diff = pos[members][np.newaxis, :, :] - pos[near][:, np.newaxis, :]
+        
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        
+        invr3 = np.zeros_like(r2)
+        
+        nonzero = r2 > 0
+        
+        invr3[nonzero] = r2[nonzero] ** -1.5
+        
+        acc[near] += G * np.einsum('ij,ijk->ik', invr3 * mass[members], diff)
+        
+    addtiming(timings, "p2p", start)
+    
+    return acc
+
+# This function checks that the fast multipole method reproduces the direct sum within a
+# relative tolerance. The direct sum is only evaluated for a random sample of target
+# bodies so that the check stays affordable for large systems. The time spent in each
+# phase of the fast multipole method and the errors are returned and printed on request.
+# Without an explicit order, the lowest order expected to meet the tolerance is used: the
+# largest relative error is about theta^(p+1), and up to about twice that, as measured
+# on a Plummer sphere of 10000 bodies:
+#
+#     order p    max error, theta = 0.5    max error, theta = 0.3
+#        1              4.1e-1                    2.1e-1
+#        3              6.6e-2                    1.5e-2
+#        5              1.4e-2                    1.4e-3
+#        7              3.6e-3                    1.2e-4
+#        9              8.3e-4                    8.6e-6
+#
+# The cost grows steeply with the order, so tight tolerances are better reached with a
+# smaller theta than with a high order.
+# @param system the StarSystem to evaluate
+# @param tolerance the largest acceptable relative error of any sampled acceleration
+# @param order the expansion order p, or None to choose it from the tolerance and theta
+# @param theta the separation ratio of the multipole acceptance criterion
+# @param leafsize the largest number of bodies stored in a leaf of the tree
+# @param sample the number of target bodies compared against the direct sum
+# @param verbose whether to print the time of each phase and the errors
+# @return a tuple (whether the tolerance was met, max relative error, rms relative error,
+#         dictionary of seconds spent in each phase)
+#
+def fmmcheck(system, tolerance=1e-2, order=None, theta=0.5, leafsize=32, sample=1000, verbose=False):
+    
+    if(order is None):
+        
+        order = max(1, math.ceil(math.log(tolerance / 2) / math.log(theta)) - 1)
+        
+    timings = {}
+    
+    approx = fmm(system.pos, system.mass, order, theta, leafsize, timings)
+    
+    chosen = np.random.default_rng(0).permutation(len(system))[:sample]
+    
+    exact = np.zeros((len(chosen),3))
+    
+    for first in range(0, len(chosen), max(1, maxpairs // max(len(system),1))):
+        
+        targets = chosen[first:first + max(1, maxpairs // max(len(system),1))]
+        
+        diff = system.pos[targets][:, np.newaxis, :] - system.pos[np.newaxis, :, :]
+        
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        
+        invr3 = np.zeros_like(r2)
+        
+        nonzero = r2 > 0
+        
+        invr3[nonzero] = r2[nonzero] ** -1.5
+        
+        exact[first:first+len(targets)] = -G * np.einsum('ij,ijk->ik', invr3 * system.mass, diff)
+        
+    norm = np.sqrt(np.einsum('ij,ij->i', exact, exact))
+    
+    norm[norm == 0] = 1
+    
+    relerror = np.sqrt(np.einsum('ij,ij->i', approx[chosen] - exact, approx[chosen] - exact)) / norm
+    
+    maxerror = relerror.max() if len(relerror) > 0 else 0.0
+    
+    rmserror = math.sqrt(np.mean(relerror ** 2)) if len(relerror) > 0 else 0.0
+    
+    if(verbose):
+        
+        for phase in ("tree", "upward", "m2l", "downward", "p2p"):
+            
+            print("%s\t%.4g s" % (phase, timings.get(phase, 0.0)))
+            
+        print("order %d, max error %.3e, rms error %.3e, tolerance %.1e" % (order, maxerror, rmserror, tolerance))
+    
+    return (maxerror <= tolerance, maxerror, rmserror, timings)
+
+# This class defines the methods and initializes the variables for a NeighborList object.
+# An object of the class NeighborList holds every pair of bodies closer than the cutoff
+# plus a skin distance, found with the spatial hash of closepairs, together with the
+# positions at which the list was built. The list stays valid, and is reused, until some
+# body has moved more than half of the skin since then.
+#
+class NeighborList:
+    
+    # Constructor initializes all of the instance variables upon
+    # instantiation of the object. The list is built on first use.
+    # @param self the bound version of this object
+    def __init__(self):
+        
+        self.left = None #the first body of each listed pair
+        
+        self.right = None #the second body of each listed pair
+        
+        self.reference = None #the positions the list was built at
+        
+        self.radius = None #the cutoff plus skin the list was built with
+        
+        self.builds = 0 #the number of times the list was built
+        
+    # This function returns the listed pairs, rebuilding the list first if it was built
+    # for a different radius or number of bodies, or if a body has moved more than half
+    # of the skin since it was built.
+    # @param self the bound version of this object
+    # @param pos an N x 3 array of positions
+    # @param cutoff the cutoff distance
+    # @param skin the skin distance
+    # @return a tuple of two arrays (i, j) with every pair closer than cutoff + skin at build time
+    def update(self, pos, cutoff, skin):
+        
+        stale = self.reference is None or self.radius != cutoff + skin or len(self.reference) != len(pos)
+        
+        if(not stale):
+            
+            moved = pos - self.reference
+            
+            stale = np.einsum('ij,ij->i', moved, moved).max() > (skin / 2) ** 2
+            
+        if(stale):
+            
+            self.left, self.right = closepairs(pos, cutoff + skin)
+            
+            self.reference = pos.copy()
+            
+            self.radius = cutoff + skin
+            
+            self.builds += 1
+            
+        return self.left, self.right
+
+# This function returns the fraction of the Plummer-softened force between two bodies
+# that the near field of cutoffaccelerations handles: 1 below half of the cutoff, 0
+# beyond the cutoff, and S(v) = (1 - v^2)^2 in between, for v the position of r^2
+# between the squares of the two. The rest, 1 - S, vanishes below half of the cutoff
+# and changes smoothly on the scale of the cutoff, and is left to the far field.
+# @param r2 an array of squared distances
+# @param cutoff the cutoff distance
+# @return an array with the near-field fraction of each force
+#
+def nearfraction(r2, cutoff):
+    
+    v = np.clip((r2 / (cutoff * cutoff) - 0.25) / 0.75, 0.0, 1.0)
+    
+    return (1 - v * v) ** 2
+
+# This function calculates the Plummer-softened gravitational acceleration of every body,
+# split at a cutoff distance into a near and a far field. The near field S(r) f(r) of
+# the pairs closer than the cutoff is summed exactly over a Verlet neighbor list with a
+# skin, which is only rebuilt once some body has moved more than half the skin. The
+# far field (1 - S(r)) f(r), which vanishes below half of the cutoff, is summed with the
+# Barnes-Hut walk of treeaccelerations with half of the cutoff as its exclusion radius,
+# so the walk leaves the pairs inside it to the list. While the cutoff is small next
+# to the system the far field has the accuracy of barneshut for the opening angle
+# theta; the far field of a cutoff near the size of the system changes on the scale
+# of the cutoff rather than of the distance, and needs a smaller theta for the same
+# accuracy.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param cutoff the cutoff distance of the near field
+# @param skin the skin distance of the neighbor list (default cutoff / 5)
+# @param softening the Plummer softening length eps (optional)
+# @param theta the opening angle of the far-field tree walk
+# @param leafsize the largest number of bodies stored in a leaf of the far-field tree
+# @param neighbors the NeighborList to reuse between steps, or None to build a new one
+# @return an N x 3 array with the acceleration of each body
+#
+def cutoffaccelerations(pos, mass, cutoff, skin=None, softening=0, theta=0.5, leafsize=8, neighbors=None):
+    
+    n = len(mass)
+    
+    acc = np.zeros((n,3))
+    
+    if(n == 0):
+        
+        return acc
+    
+    if(skin is None):
+        
+        skin = cutoff / 5
+        
+    if(neighbors is None):
+        
+        neighbors = NeighborList()
+        
+    eps2 = softening * softening
+    
+    # near field over the neighbor list
+    
+    left, right = neighbors.update(pos, cutoff, skin)
+    
+    diff = pos[left] - pos[right]
+    
+    r2 = np.einsum('ij,ij->i', diff, diff)
+    
+    near = (r2 < cutoff * cutoff) & (r2 > 0)
+    
+    left = left[near]
+    
+    right = right[near]
+    
+    diff = diff[near]
+    
+    weight = G * nearfraction(r2[near], cutoff) * (r2[near] + eps2) ** -1.5
+    
+    for k in range(3):
+        
+        acc[:, k] -= np.bincount(left, weights=weight * mass[right] * diff[:, k], minlength=n)
+        
+        acc[:, k] += np.bincount(right, weights=weight * mass[left] * diff[:, k], minlength=n)
+        
+    # far field over the tree, where most pairs are beyond the cutoff and need no split
+    
+    def farweight(r2):
+        
+        weight = (r2 + eps2) ** -1.5
+        
+        band = r2 < cutoff * cutoff
+        
+        weight[band] *= 1 - nearfraction(r2[band], cutoff)
+        
+        return weight
+    
+    acc += treeaccelerations(pos, mass, theta, leafsize, farweight, cutoff / 2)
+        
+    return acc
+
+# This function returns the complementary error function of an array of non-negative
+# values, using the rational approximation 7.1.26 of Abramowitz and Stegun (absolute
+# error below 1.5e-7), since math.erfc only takes one value at a time.
+# @param x an array of non-negative values
+# @return an array with erfc of each value
+#
+def erfc(x):
+    
+    t = 1 / (1 + 0.3275911 * x)
+    
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    
+    return poly * np.exp(-x * x)
+
+# This function returns the cloud-in-cell stencil of each body on a periodic grid: the
+# flat indices of the 8 grid points around the body and the weight of each of them.
+# @param pos an N x 3 array of positions, already reduced into the box
+# @param spacing the grid spacing
+# @param grid the number of grid points along each axis
+# @return a tuple of two 8 x N arrays (flat indices, weights)
+#
+def cloudincell(pos, spacing, grid):
+    
+    scaled = pos / spacing
+    
+    base = np.floor(scaled).astype(np.int64)
+    
+    frac = scaled - base
+    
+    indices = np.empty((8, len(pos)), dtype=np.int64)
+    
+    weights = np.empty((8, len(pos)))
+    
+    corner = 0
+    
+    for dx in (0, 1):
+        
+        for dy in (0, 1):
+            
+            for dz in (0, 1):
+                
+                indices[corner] = (((base[:,0] + dx) % grid) * grid + (base[:,1] + dy) % grid) * grid + (base[:,2] + dz) % grid
+                
+                weights[corner] = (frac[:,0] if dx else 1 - frac[:,0]) * (frac[:,1] if dy else 1 - frac[:,1]) * (frac[:,2] if dz else 1 - frac[:,2])
+                
+                corner += 1
+                
+    return indices, weights
+
+# This function returns every pair of bodies closer than a radius in a periodic box, in
+# both orders, with the separation of their nearest images. Bodies within the radius of
+# a face are copied across it as ghosts, so the spatial hash of closepairs finds the
+# pairs that wrap around the box; the radius must be below half of the box.
+# @param pos an N x 3 array of positions, already reduced into the box
+# @param box the side length of the periodic box
+# @param radius the distance below which bodies form a pair
+# @return a tuple of three arrays (i, j, separation) with every pair and pos[i] - pos[j]
+#
+def periodicpairs(pos, box, radius):
+    
+    n = len(pos)
+    
+    points = [pos]
+    
+    source = [np.arange(n)]
+    
+    for sx in (-1, 0, 1):
+        
+        for sy in (-1, 0, 1):
+            
+            for sz in (-1, 0, 1):
+                
+                shift = np.array([sx, sy, sz])
+                
+                if(not shift.any()):
+                    
+                    continue
+                
+                # a body near the low face is copied above the high face and vice versa
+                near = np.all((shift == 0) | ((shift > 0) & (pos < radius)) | ((shift < 0) & (pos >= box - radius)), axis=1)
+                
+                points.append(pos[near] + shift * box)
+                
+                source.append(np.nonzero(near)[0])
+                
+    points = np.concatenate(points)
+    
+    source = np.concatenate(source)
+    
+    left, right = closepairs(points, radius)
+    
+    # closepairs lists left < right, so a pair with an original body has it on the left;
+    # a pair across a face is found once from each side, a pair inside the box only once
+    keep = left < n
+    
+    left = left[keep]
+    
+    right = right[keep]
+    
+    separation = points[left] - points[right]
+    
+    inside = right < n
+    
+    return np.concatenate((left, right[inside])), np.concatenate((source[right], left[inside])), np.concatenate((separation, -separation[inside]))
+
+# This function calculates the gravitational acceleration of every body in a periodic
+# box with the particle-mesh method. The masses are assigned to a grid with the
+# cloud-in-cell scheme, the Poisson equation is solved with FFTs, and the mesh forces
+# are interpolated back with the same scheme, for O(N + M log M) work with M grid
+# points. As usual for periodic gravity, the mean density does not attract. Positions
+# outside the box are reduced into it, so they can be left unwrapped.
+# The mesh force is always smoothed with a Gaussian of width split grid spacings, which
+# keeps the deconvolution of the cloud-in-cell window from amplifying the grid-scale
+# modes, so on its own it only resolves pairs farther apart than about 4.5 widths.
+# With p3m the remaining short-range force of the pairs closer than that is summed
+# directly (P3M), which resolves the force below the grid spacing.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param box the side length of the periodic box
+# @param grid the number of grid points along each axis (default 64)
+# @param p3m whether to add the direct short-range correction (default False)
+# @param split the width of the Gaussian smoothing in grid spacings (default 1.25)
+# @return an N x 3 array with the acceleration of each body
+#
+def particlemesh(pos, mass, box, grid=64, p3m=False, split=1.25):
+    
+    n = len(mass)
+    
+    acc = np.zeros((n,3))
+    
+    if(n == 0):
+        
+        return acc
+    
+    spacing = box / grid
+    
+    wrapped = np.mod(pos, box)
+    
+    indices, weights = cloudincell(wrapped, spacing, grid)
+    
+    density = np.bincount(indices.ravel(), weights=(weights * mass).ravel(), minlength=grid**3)
+    
+    densityk = np.fft.rfftn(density.reshape(grid, grid, grid) / spacing**3)
+    
+    kx = 2 * math.pi * np.fft.fftfreq(grid, spacing)[:, np.newaxis, np.newaxis]
+    
+    ky = 2 * math.pi * np.fft.fftfreq(grid, spacing)[np.newaxis, :, np.newaxis]
+    
+    kz = 2 * math.pi * np.fft.rfftfreq(grid, spacing)[np.newaxis, np.newaxis, :]
+    
+    k2 = kx * kx + ky * ky + kz * kz
+    
+    k2[0,0,0] = 1
+    
+    green = -4 * math.pi * G / k2
+    
+    green[0,0,0] = 0 #the mean density does not attract
+    
+    # deconvolve the cloud-in-cell window once for the assignment and once for the interpolation
+    window = (np.sinc(kx * spacing / (2 * math.pi)) * np.sinc(ky * spacing / (2 * math.pi)) * np.sinc(kz * spacing / (2 * math.pi))) ** 2
+    
+    # the Gaussian keeps the deconvolution from amplifying the grid-scale modes
+    width = split * spacing
+    
+    potentialk = green * densityk * np.exp(-k2 * width * width) / window**2
+    
+    for k, wave in enumerate((kx, ky, kz)):
+        
+        wave = np.where(np.abs(wave) * spacing >= math.pi * (1 - 1e-12), 0, wave) #drop the Nyquist mode of the derivative
+        
+        field = np.fft.irfftn(-1j * wave * potentialk, s=(grid, grid, grid), axes=(0, 1, 2)).ravel()
+        
+        acc[:,k] = np.einsum('ij,ij->j', weights, field[indices])
+        
+    if(p3m):
+        
+        radius = 4.5 * width
+        
+        if(radius >= box / 2):
+            
+            raise ValueError("the P3M cutoff of %g must be below half of the box" % radius)
+        
+        left, right, separation = periodicpairs(wrapped, box, radius)
+        
+        r = np.sqrt(np.einsum('ij,ij->i', separation, separation))
+        
+        apart = r > 0
+        
+        left, right, separation, r = left[apart], right[apart], separation[apart], r[apart]
+        
+        u = r / (2 * width)
+        
+        strength = G * (erfc(u) + 2 * u / math.sqrt(math.pi) * np.exp(-u * u)) / r**3
+        
+        for k in range(3):
+            
+            acc[:,k] -= np.bincount(left, weights=strength * mass[right] * separation[:,k], minlength=n)
+            
+    return acc
+
+methods = {"direct": accelerations, "barnes_hut": barneshut, "fmm": fmm, "cutoff": cutoffaccelerations, "pm": particlemesh} #force backends selectable in evolve()
+
+# This function is the loop run by each worker process of a ParallelForces pool. The
+# worker attaches to the shared position, velocity, mass and acceleration arrays once,
+# and then, for every step, waits at the barrier for the main process to release it,
+# computes the accelerations of its block of target bodies into the shared array, and
+# waits at the barrier again so that the main process only drifts once every block is done.
+# @param names the names of the shared memory blocks (positions, velocities, masses, accelerations)
+# @param n the number of bodies
+# @param first the first target body of this worker
+# @param last one past the last target body of this worker
+# @param tile the number of target bodies per tile of the force kernel
+# @param softening the Plummer softening length of the force kernel
+# @param precision the precision of the force kernel, "double" or "single"
+# @param barrier the Barrier shared by the workers and the main process
+# @param running a shared flag that is cleared when the pool is closed
+#
+def forceworker(names, n, first, last, tile, softening, precision, barrier, running):
+    
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    
+    pos = np.ndarray((n,3), dtype=np.float64, buffer=blocks[0].buf)
+    
+    mass = np.ndarray((n,), dtype=np.float64, buffer=blocks[2].buf)
+    
+    acc = np.ndarray((n,3), dtype=np.float64, buffer=blocks[3].buf)
+    
+    try:
+        
+        while(True):
+            
+            barrier.wait()
+            
+            if(not running.value):
+                
+                break
+            
+            acc[first:last] = accelerations(pos, mass, tile, first, last, softening=softening, precision=precision)
+            
+            barrier.wait()
+            
+    except threading.BrokenBarrierError:
+        
+        pass
+    
+    except BaseException:
+        
+        barrier.abort()
+        
+        raise
+    
+    finally:
+        
+        del pos, mass, acc
+        
+        for block in blocks:
+            
+            block.close()
+
+# This class defines the methods and initializes the variables for a ParallelForces object.
+# An object of the class ParallelForces moves the position, velocity and mass arrays of a
+# StarSystem into multiprocessing shared memory and starts a persistent pool of worker
+# processes that each compute the direct-sum accelerations of one block of target bodies.
+# The same workers are reused for every step until the pool is closed, at which point
+# the system gets private copies of its arrays back.
+#
+class ParallelForces:
+    
+    # Constructor initializes all of the instance variables and starts the
+    # workers upon instantiation of the object.
+    # @param self the bound version of this object
+    # @param system the StarSystem whose arrays are shared with the workers
+    # @param workers the number of worker processes, or None for one per core
+    # @param tile the number of target bodies per tile of the force kernel (optional)
+    # @param softening the Plummer softening length of the force kernel (optional)
+    # @param precision the precision of the force kernel, "double" or "single" (optional)
+    def __init__(self, system, workers=None, tile=None, softening=0, precision="double"):
+        
+        if(workers is None):
+            
+            workers = os.cpu_count() or 1
+            
+        n = len(system)
+        
+        workers = max(1, min(workers, n))
+        
+        self.system = system
+        
+        self.blocks = [shared_memory.SharedMemory(create=True, size=max(size, 1)) for size in (n * 24, n * 24, n * 8, n * 24)]
+        
+        arrays = [np.ndarray(shape, dtype=np.float64, buffer=block.buf) for shape, block in zip(((n,3), (n,3), (n,), (n,3)), self.blocks)]
+        
+        arrays[0][:] = system.pos
+        
+        arrays[1][:] = system.v
+        
+        arrays[2][:] = system.mass
+        
+        system.pos, system.v, system.mass, self.acc = arrays
+        
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        
+        context = multiprocessing.get_context(method)
+        
+        self.barrier = context.Barrier(workers + 1)
+        
+        self.running = context.Value('b', 1)
+        
+        bounds = [n * k // workers for k in range(workers + 1)]
+        
+        names = [block.name for block in self.blocks]
+        
+        self.workers = [context.Process(target=forceworker, args=(names, n, bounds[k], bounds[k+1], tile, softening, precision, self.barrier, self.running), daemon=True) for k in range(workers)]
+        
+        for worker in self.workers:
+            
+            worker.start()
+            
+    # This function computes the accelerations of every body of the system with
+    # the worker pool and returns them once every block is done.
+    # @param self the bound version of this object
+    # @param pos an N x 3 array of positions, copied into shared memory if it is not already there
+    # @param mass an array of N masses, copied into shared memory if it is not already there
+    # @param options ignored keyword options of the serial backend
+    # @return the shared N x 3 array with the acceleration of each body
+    def accelerations(self, pos=None, mass=None, **options):
+        
+        if(pos is not None and pos is not self.system.pos):
+            
+            self.system.pos[:] = pos
+            
+        if(mass is not None and mass is not self.system.mass):
+            
+            self.system.mass[:] = mass
+        
+        self.barrier.wait() #releases the workers
+        
+        self.barrier.wait() #waits for every block before the drift
+        
+        return self.acc
+    
+    # This function stops the workers, gives the system private copies of its arrays,
+    # and releases the shared memory.
+    # @param self the bound version of this object
+    def close(self):
+        
+        if(self.blocks is None):
+            
+            return
+        
+        self.running.value = 0
+        
+        try:
+            
+            self.barrier.wait(timeout=10)
+            
+        except threading.BrokenBarrierError:
+            
+            pass
+        
+        for worker in self.workers:
+            
+            worker.join(timeout=10)
+            
+            if(worker.is_alive()):
+                
+                worker.terminate()
+                
+        self.system.pos = self.system.pos.copy()
+        
+        self.system.v = self.system.v.copy()
+        
+        self.system.mass = self.system.mass.copy()
+        
+        self.acc = None
+        
+        for block in self.blocks:
+            
+            block.close()
+            
+            block.unlink()
+            
+        self.blocks = None
+        
+    # These functions allow the pool to be used in a with statement that closes it.
+    # @param self the bound version of this object
+    def __enter__(self):
+        
+        return self
+    
+    def __exit__(self, *exception):
+        
+        self.close()
+
+# This function measures how the time per step of the direct sum scales with the number
+# of worker processes, and returns the seconds per step and the speedup relative to one
+# worker, which are also printed on request. The system is restored to its starting
+# state after each run.
+# @param system the StarSystem to evolve
+# @param delt the change in time per step
+# @param steps the number of steps timed for each worker count
+# @param workers the worker counts to compare, or None for powers of two up to the core count
+# @param verbose whether to print the table of timings
+# @return a list of (workers, seconds per step, speedup) tuples
+#
+def parallelbenchmark(system, delt, steps=5, workers=None, verbose=False):
+    
+    if(workers is None):
+        
+        cores = os.cpu_count() or 1
+        
+        workers = [2 ** k for k in range(int(math.log2(cores)) + 1)]
+        
+        if(workers[-1] != cores):
+            
+            workers.append(cores)
+            
+    state = (system.pos.copy(), system.v.copy(), system.mass.copy())
+    
+    rows = []
+    
+    for count in workers:
+        
+        with ParallelForces(system, count) as pool:
+            
+            pool.accelerations() #warms up the workers
+            
+            start = timer.perf_counter()
+            
+            evolve(system, delt * (steps - 1), delt, pool=pool)
+            
+            seconds = (timer.perf_counter() - start) / steps
+            
+        system.pos, system.v, system.mass = state[0].copy(), state[1].copy(), state[2].copy()
+        
+        rows.append((count, seconds, rows[0][1] / seconds if len(rows) > 0 else 1.0))
+        
+    if(verbose):
+        
+        print("workers\tseconds/step\tspeedup")
+        
+        for row in rows:
+            
+            print("%d\t%.4g\t%.2f" % row)
+        
+    return rows
+
+# This function compares the Barnes-Hut accelerations of a system against the direct sum
+# for several opening angles, and returns the wall-clock time of each backend along with
+# the RMS and maximum relative error of the Barnes-Hut accelerations, printed on request.
+# @param system the StarSystem to evaluate
+# @param thetas the opening angles to compare
+# @param leafsize the largest number of bodies stored in a leaf of the tree
+# @param verbose whether to print the table of timings and errors
+# @return a list of (theta, seconds, rms relative error, max relative error) tuples,
+#         where the first entry, with theta 0, is the direct sum itself
+#
+def barneshutreport(system, thetas=(0.2, 0.4, 0.6, 0.8, 1.0), leafsize=8, verbose=False):
+    
+    start = timer.perf_counter()
+    
+    exact = accelerations(system.pos, system.mass)
+    
+    rows = [(0.0, timer.perf_counter() - start, 0.0, 0.0)]
+    
+    norm = np.sqrt(np.einsum('ij,ij->i', exact, exact))
+    
+    norm[norm == 0] = 1
+    
+    for theta in thetas:
+        
+        start = timer.perf_counter()
+        
+        approx = barneshut(system.pos, system.mass, theta, leafsize)
+        
+        seconds = timer.perf_counter() - start
+        
+        relerror = np.sqrt(np.einsum('ij,ij->i', approx - exact, approx - exact)) / norm
+        
+        rows.append((theta, seconds, math.sqrt(np.mean(relerror ** 2)), relerror.max()))
+        
+    if(verbose):
+        
+        print("theta\tseconds\trms error\tmax error")
+        
+        for row in rows:
+            
+            print("%g\t%.4g\t%.3e\t%.3e" % row)
+        
+    return rows
+
+# This function advances the system by one step of the original first-order scheme:
+# every velocity is kicked by the current accelerations and then every position is
+# drifted by the new velocities.
+# @param system the StarSystem to advance
+# @param delt the change in time
+# @param force the function that returns the accelerations for the positions and masses
+# @param options keyword options for the force function
+#
+def eulerstep(system, delt, force, options):
+    
+    system.v += force(system.pos, system.mass, **options) * delt
+    
+    system.pos += system.v * delt
+    
+    system.acc = None
+
+# This function advances the system by one kick-drift-kick leapfrog step: a half kick
+# with the accelerations left by the previous step, a full drift, and a half kick with
+# the accelerations at the new positions, which are kept for the next step.
+# @param system the StarSystem to advance
+# @param delt the change in time
+# @param force the function that returns the accelerations for the positions and masses
+# @param options keyword options for the force function
+#
+def leapfrogstep(system, delt, force, options):
+    
+    if(system.acc is None):
+        
+        system.acc = np.array(force(system.pos, system.mass, **options))
+        
+    system.v += system.acc * (delt / 2)
+    
+    system.pos += system.v * delt
+    
+    system.acc = np.array(force(system.pos, system.mass, **options))
+    
+    system.v += system.acc * (delt / 2)
+
+# This function advances the system by one velocity Verlet step: the positions move by
+# v delt + a delt^2 / 2 and the velocities by the average of the old and new accelerations.
+# @param system the StarSystem to advance
+# @param delt the change in time
+# @param force the function that returns the accelerations for the positions and masses
+# @param options keyword options for the force function
+#
+def verletstep(system, delt, force, options):
+    
+    if(system.acc is None):
+        
+        system.acc = np.array(force(system.pos, system.mass, **options))
+        
+    system.pos += system.v * delt + system.acc * (delt * delt / 2)
+    
+    acc = np.array(force(system.pos, system.mass, **options))
+    
+    system.v += (system.acc + acc) * (delt / 2)
+    
+    system.acc = acc
+
+yoshidaw1 = 1 / (2 - 2 ** (1 / 3)) #the weights of the Yoshida / Forest-Ruth fourth order scheme
+
+yoshidaw0 = -(2 ** (1 / 3)) * yoshidaw1
+
+yoshidadrifts = (yoshidaw1 / 2, (yoshidaw0 + yoshidaw1) / 2, (yoshidaw0 + yoshidaw1) / 2, yoshidaw1 / 2)
+
+yoshidakicks = (yoshidaw1, yoshidaw0, yoshidaw1)
+
+# This function advances the system by one step of the fourth order symplectic scheme of
+# Yoshida and Forest-Ruth: four drifts and three kicks with the weights above, which
+# costs three force evaluations per step.
+# @param system the StarSystem to advance
+# @param delt the change in time
+# @param force the function that returns the accelerations for the positions and masses
+# @param options keyword options for the force function
+#
+def yoshidastep(system, delt, force, options):
+    
+    for k in range(3):
+        
+        system.pos += system.v * (yoshidadrifts[k] * delt)
+        
+        system.v += force(system.pos, system.mass, **options) * (yoshidakicks[k] * delt)
+        
+    system.pos += system.v * (yoshidadrifts[3] * delt)
+    
+    system.acc = None
+
+# This function calculates the gravitational acceleration and its time derivative (the
+# jerk) of the given target bodies due to every body, in tiles of target bodies.
+# Pairs that are separated by a distance of zero are skipped. With a softening length
+# eps, both are those of the Plummer-softened force, with r^2 + eps^2 in place of r^2.
+# @param pos an N x 3 array of positions
+# @param v an N x 3 array of velocities
+# @param mass an array of N masses
+# @param targets an array with the indices of the target bodies
+# @param tile the number of target bodies per tile, or None to choose it from maxpairs
+# @param softening the Plummer softening length eps (optional)
+# @return a tuple of two K x 3 arrays with the acceleration and the jerk of each target
+#
+def accelerationsjerks(pos, v, mass, targets, tile=None, softening=0):
+    
+    n = len(mass)
+    
+    acc = np.zeros((len(targets),3))
+    
+    jerk = np.zeros((len(targets),3))
+    
+    if(tile is None):
+        
+        tile = max(1, maxpairs // max(2 * n,1))
+        
+    for start in range(0, len(targets), tile):
+        
+        chosen = targets[start:start+tile]
+        
+        dx = pos[chosen, np.newaxis, :] - pos[np.newaxis, :, :]
+        
+        dv = v[chosen, np.newaxis, :] - v[np.newaxis, :, :]
+        
+        r2 = np.einsum('ijk,ijk->ij', dx, dx)
+        
+        invr2 = np.zeros_like(r2)
+        
+        nonzero = r2 > 0
+        
+        invr2[nonzero] = 1 / (r2[nonzero] + softening * softening)
+        
+        weight = mass * invr2 * np.sqrt(invr2) #m_j / (r^2 + eps^2)^(3/2)
+        
+        rv = 3 * np.einsum('ijk,ijk->ij', dx, dv) * invr2
+        
+        acc[start:start+len(chosen)] = -G * np.einsum('ij,ijk->ik', weight, dx)
+        
+        jerk[start:start+len(chosen)] = -G * (np.einsum('ij,ijk->ik', weight, dv) - np.einsum('ij,ijk->ik', weight * rv, dx))
+        
+    return acc, jerk
+
+# This function chooses the timestep level of each body from its acceleration and jerk.
+# The desired step is eta * |a| / |jerk|, the time over which the acceleration changes
+# by a fraction eta, and the level is the smallest l for which delt / 2^l does not exceed it.
+# @param acc a K x 3 array of accelerations
+# @param jerk a K x 3 array of jerks
+# @param delt the largest (level 0) timestep
+# @param eta the accuracy parameter of the timestep criterion
+# @param levels the deepest level allowed
+# @return an array with the level of each body
+#
+def blocklevels(acc, jerk, delt, eta, levels):
+    
+    a = np.sqrt(np.einsum('ij,ij->i', acc, acc))
+    
+    j = np.sqrt(np.einsum('ij,ij->i', jerk, jerk))
+    
+    wanted = np.full(len(a), float(delt))
+    
+    moving = (a > 0) & (j > 0)
+    
+    wanted[moving] = eta * a[moving] / j[moving]
+    
+    return np.clip(np.ceil(np.log2(delt / wanted)), 0, levels).astype(int)
+
+# This function advances the system by delt with hierarchical block timesteps. Every body
+# has a power of two level l and a step of delt / 2^l chosen from its acceleration and
+# jerk. The step of delt is split into 2^levels substeps; all positions drift every
+# substep, but only the bodies whose steps begin or end are kicked (kick-drift-kick),
+# and the forces are only evaluated for the bodies whose steps end. A body may move to
+# a shorter step at the end of any of its steps and to the next longer step only when
+# the longer step would also end there.
+# @param system the StarSystem to advance
+# @param delt the largest (level 0) timestep
+# @param force ignored; the block integrator evaluates the direct sum for the active bodies
+# @param options keyword options: levels (deepest level, default 8), eta (accuracy
+#        parameter, default 0.02), tile, softening, and stats (a dictionary that the
+#        number of "substeps", "active" target force evaluations, "bodies" and "deepest"
+#        level used are added to)
+#
+def blockstep(system, delt, force, options):
+    
+    levels = options.get("levels", 8)
+    
+    eta = options.get("eta", 0.02)
+    
+    tile = options.get("tile")
+    
+    softening = options.get("softening", 0)
+    
+    stats = options.get("stats")
+    
+    n = len(system)
+    
+    everyone = np.arange(n)
+    
+    if(system.acc is None or system.level is None):
+        
+        acc, jerk = accelerationsjerks(system.pos, system.v, system.mass, everyone, tile, softening)
+        
+        system.acc = acc
+        
+        system.level = blocklevels(acc, jerk, delt, eta, levels)
+        
+    substeps = 2 ** levels
+    
+    dtmin = delt / substeps
+    
+    active = 0
+    
+    deepest = system.level.max() if n > 0 else 0
+    
+    for k in range(substeps):
+        
+        period = 2 ** (levels - system.level) #the number of substeps in the step of each body
+        
+        starting = (k % period) == 0
+        
+        system.v[starting] += system.acc[starting] * (period[starting] * dtmin / 2)[:, np.newaxis]
+        
+        system.pos += system.v * dtmin
+        
+        ending = np.nonzero(((k + 1) % period) == 0)[0]
+        
+        if(len(ending) == 0):
+            
+            continue
+        
+        acc, jerk = accelerationsjerks(system.pos, system.v, system.mass, ending, tile, softening)
+        
+        system.acc[ending] = acc
+        
+        system.v[ending] += acc * (period[ending] * dtmin / 2)[:, np.newaxis]
+        
+        current = system.level[ending]
+        
+        wanted = blocklevels(acc, jerk, delt, eta, levels)
+        
+        aligned = ((k + 1) % (2 * period[ending])) == 0
+        
+        system.level[ending] = np.where(wanted < current, np.where(aligned, current - 1, current), wanted)
+        
+        active += len(ending)
+        
+        deepest = max(deepest, system.level.max())
+        
+    if(stats is not None):
+        
+        stats["substeps"] = stats.get("substeps", 0) + substeps
+        
+        stats["active"] = stats.get("active", 0) + active
+        
+        stats["bodies"] = n
+        
+        stats["deepest"] = max(stats.get("deepest", 0), int(deepest))
+
+# This function evolves a copy of the system with block timesteps and returns the number
+# of target force evaluations it needed, the number a shared timestep as short as the
+# shortest block step used would have needed over the same time, and their ratio, which
+# are also printed on request.
+# @param system the StarSystem to evolve (it is not changed)
+# @param time the total amount of time in seconds
+# @param delt the largest (level 0) timestep
+# @param levels the deepest level allowed
+# @param eta the accuracy parameter of the timestep criterion
+# @param verbose whether to print the counts of force evaluations
+# @return a tuple (block evaluations, shared timestep evaluations, reduction factor)
+#
+def blockreport(system, time, delt, levels=8, eta=0.02, verbose=False):
+    
+    copy = StarSystem(system.pos, system.v, system.mass)
+    
+    stats = {}
+    
+    evolve(copy, time, delt, integrator="block", levels=levels, eta=eta, stats=stats)
+    
+    shared = stats["bodies"] * (stats["substeps"] // 2 ** levels) * 2 ** stats["deepest"]
+    
+    factor = shared / max(stats["active"], 1)
+    
+    if(verbose):
+        
+        print("block evaluations %d, shared timestep evaluations %d, reduction %.1fx" % (stats["active"], shared, factor))
+    
+    return (stats["active"], shared, factor)
+
+integrators = {"euler": eulerstep, "leapfrog": leapfrogstep, "verlet": verletstep, "yoshida": yoshidastep, "block": blockstep} #integrators selectable in evolve()
+
+# This function calculates the total energy of the system, the kinetic energy of every
+# body plus the gravitational potential energy of every pair, summed in tiles of target
+# bodies. Pairs that are separated by a distance of zero are skipped.
+# @param system the StarSystem to evaluate
+# @param tile the number of target bodies per tile, or None to choose it from maxpairs
+# @return the total energy (in joules)
+#
+def energy(system, tile=None):
+    
+    n = len(system)
+    
+    kinetic = 0.5 * np.dot(system.mass, np.einsum('ij,ij->i', system.v, system.v))
+    
+    potential = 0.0
+    
+    if(tile is None):
+        
+        tile = max(1, maxpairs // max(n,1))
+        
+    for start in range(0, n, tile):
+        
+        stop = min(start + tile, n)
+        
+        diff = system.pos[start:stop, np.newaxis, :] - system.pos[np.newaxis, :, :]
+        
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        
+        invr = np.zeros_like(r2)
+        
+        nonzero = r2 > 0
+        
+        invr[nonzero] = r2[nonzero] ** -0.5
+        
+        potential -= 0.5 * G * np.dot(system.mass[start:stop], invr @ system.mass)
+        
+    return kinetic + potential
+
+# This function compares the integrators by evolving a copy of the system with each of
+# them at each of the given step sizes, and returns the wall-clock time and the relative
+# energy error |E - E0| / |E0| at the end of every run, printed on request.
+# @param system the StarSystem to evolve (it is not changed)
+# @param time the total amount of time in seconds
+# @param delts the step sizes to try
+# @param names the integrators to compare
+# @param method the force backend
+# @param verbose whether to print the table of timings and energy errors
+# @param options keyword options for the force backend
+# @return a list of (integrator, delt, seconds, relative energy error) tuples
+#
+def integratorreport(system, time, delts, names=("euler", "leapfrog", "verlet", "yoshida"), method="direct", verbose=False, **options):
+    
+    initial = energy(system)
+    
+    rows = []
+    
+    for name in names:
+        
+        for delt in delts:
+            
+            copy = StarSystem(system.pos, system.v, system.mass)
+            
+            start = timer.perf_counter()
+            
+            evolve(copy, time, delt, method, integrator=name, **options)
+            
+            seconds = timer.perf_counter() - start
+            
+            rows.append((name, delt, seconds, abs((energy(copy) - initial) / initial)))
+            
+    if(verbose):
+        
+        print("integrator\tdelt\tseconds\tenergy error")
+        
+        for row in rows:
+            
+            print("%s\t%g\t%.4g\t%.3e" % row)
+        
+    return rows
+
+# This function measures the accuracy and speed of the mixed-precision force kernel
+# against the float64 one. It times a single force evaluation with each precision
+# (the best of a few), compares the accelerations, and evolves a copy of the system
+# with each precision to compare the final positions and the energy errors.
+# @param system the StarSystem to evolve (it is not changed)
+# @param time the total amount of time in seconds
+# @param delt the change in time
+# @param integrator the time integrator
+# @param repeats the number of timed force evaluations of each precision
+# @param verbose whether to print the timings and errors
+# @param options keyword options for the force backend
+# @return a dictionary with the seconds per force evaluation of each precision, the
+#         median and maximum relative acceleration error, the maximum position
+#         difference relative to the size of the system, and both energy errors
+#
+def precisionreport(system, time, delt, integrator="leapfrog", repeats=3, verbose=False, **options):
+    
+    seconds = {}
+    
+    forces = {}
+    
+    for precision in ("double", "single"):
+        
+        best = float("inf")
+        
+        for k in range(repeats):
+            
+            start = timer.perf_counter()
+            
+            forces[precision] = accelerations(system.pos, system.mass, precision=precision, **options)
+            
+            best = min(best, timer.perf_counter() - start)
+            
+        seconds[precision] = best
+        
+    size = np.linalg.norm(forces["double"], axis=1)
+    
+    relative = np.linalg.norm(forces["single"] - forces["double"], axis=1) / np.where(size > 0, size, 1)
+    
+    initial = energy(system)
+    
+    runs = {}
+    
+    for precision in ("double", "single"):
+        
+        runs[precision] = evolve(StarSystem(system.pos, system.v, system.mass), time, delt, integrator=integrator, precision=precision, **options)
+        
+    extent = np.abs(system.pos - system.pos.mean(axis=0)).max() or 1.0
+    
+    report = {"double seconds": seconds["double"],
+              "single seconds": seconds["single"],
+              "median force error": float(np.median(relative)),
+              "max force error": float(relative.max()),
+              "max position difference": float(np.abs(runs["single"].pos - runs["double"].pos).max() / extent),
+              "double energy error": abs((energy(runs["double"]) - initial) / initial),
+              "single energy error": abs((energy(runs["single"]) - initial) / initial)}
+    
+    if(verbose):
+        
+        print("seconds per force evaluation: %.4g (double), %.4g (single), speedup %.2f" % (seconds["double"], seconds["single"], seconds["double"] / seconds["single"]))
+        
+        print("relative force error: %.3e (median), %.3e (max)" % (report["median force error"], report["max force error"]))
+        
+        print("final position difference / system size: %.3e" % report["max position difference"])
+        
+        print("energy error: %.3e (double), %.3e (single)" % (report["double energy error"], report["single energy error"]))
+    
+    return report
+
+# This class defines the methods and initializes the variables for a TrajectoryRecorder object.
+# An object of the class TrajectoryRecorder stores decimated snapshots of the positions and
+# velocities of a StarSystem during a run. Snapshots are kept either every few steps or
+# every so much simulated time, copied row-for-row from the arrays of the system into
+# memory-mapped .npy chunk files (time-#####.npy, pos-#####.npy and v-#####.npy) in a
+# directory, so a long run never holds its whole history in memory. The most recent
+# snapshots are also kept in a bounded ring buffer for live inspection. Chunks already in
+# the directory are never overwritten: new chunks are numbered after them.
+#
+class TrajectoryRecorder:
+    
+    # Constructor initializes all of the instance variables upon
+    # instantiation of the object.
+    # @param self the bound version of this object
+    # @param directory the directory the chunk files are written to (created if needed)
+    # @param every keep a snapshot every this many steps
+    # @param cadence keep a snapshot every this many seconds of simulated time instead (optional)
+    # @param chunk the number of snapshots in each chunk file
+    # @param ringsize the number of recent snapshots kept in memory
+    def __init__(self, directory, every=1, cadence=None, chunk=256, ringsize=16):
+        
+        os.makedirs(directory, exist_ok=True)
+        
+        self.directory = directory
+        
+        self.every = every
+        
+        self.cadence = cadence
+        
+        self.chunk = chunk
+        
+        self.ringsize = ringsize
+        
+        self.steps = 0 #the number of steps offered to the recorder
+        
+        self.next = None #the simulated time of the next snapshot when a cadence is used
+        
+        self.chunks = 0 #the number of chunk files started, including those already on disk
+        
+        while(os.path.exists(self.chunkpath("time", self.chunks))):
+            
+            self.chunks += 1
+        
+        self.filled = 0 #the number of snapshots in the current chunk
+        
+        self.arrays = None #the memory-mapped (time, pos, v) arrays of the current chunk
+        
+        self.ring = None #the (time, pos, v) arrays of the ring buffer
+        
+        self.ringcount = 0 #the number of snapshots ever written to the ring buffer
+        
+    # This function offers the state of the system after a step to the recorder, which
+    # keeps a snapshot if the step or simulated time falls on the decimation cadence.
+    # @param self the bound version of this object
+    # @param system the StarSystem being evolved
+    # @param time the simulated time of the state
+    # @return whether a snapshot was kept
+    def record(self, system, time):
+        
+        self.steps += 1
+        
+        if(self.cadence is not None):
+            
+            if(self.next is not None and time < self.next):
+                
+                return False
+            
+            self.next = (self.next if self.next is not None else time) + self.cadence
+            
+            while(self.next <= time):
+                
+                self.next += self.cadence
+                
+        elif((self.steps - 1) % self.every != 0):
+            
+            return False
+        
+        n = len(system)
+        
+        if(self.arrays is not None and self.arrays[1].shape[1] != n):
+            
+            self.finishchunk()
+            
+        if(self.arrays is None):
+            
+            self.startchunk(n)
+            
+        for array, value in zip(self.arrays, (time, system.pos, system.v)):
+            
+            array[self.filled] = value
+            
+        self.filled += 1
+        
+        if(self.ring is None or self.ring[1].shape[1] != n):
+            
+            self.ring = (np.zeros(self.ringsize), np.zeros((self.ringsize, n, 3)), np.zeros((self.ringsize, n, 3)))
+            
+            self.ringcount = 0
+            
+        for array, value in zip(self.ring, (time, system.pos, system.v)):
+            
+            array[self.ringcount % self.ringsize] = value
+            
+        self.ringcount += 1
+        
+        if(self.filled == self.chunk):
+            
+            self.finishchunk()
+            
+        return True
+    
+    # This function returns the most recent snapshots kept in the ring buffer, oldest first.
+    # @param self the bound version of this object
+    # @param count the number of snapshots wanted, or None for all of the buffered ones
+    # @return a tuple of copies of the times (K), positions (K x N x 3) and velocities (K x N x 3)
+    def latest(self, count=None):
+        
+        if(self.ring is None):
+            
+            return (np.zeros(0), np.zeros((0, 0, 3)), np.zeros((0, 0, 3)))
+        
+        available = min(self.ringcount, self.ringsize)
+        
+        count = available if count is None else min(count, available)
+        
+        rows = np.arange(self.ringcount - count, self.ringcount) % self.ringsize
+        
+        return tuple(array[rows] for array in self.ring)
+    
+    # This function creates the memory-mapped files of a new chunk.
+    # @param self the bound version of this object
+    # @param n the number of bodies in each snapshot
+    def startchunk(self, n):
+        
+        shapes = ((self.chunk,), (self.chunk, n, 3), (self.chunk, n, 3))
+        
+        self.arrays = [np.lib.format.open_memmap(self.chunkpath(name, self.chunks), mode='w+', dtype=np.float64, shape=shape) for name, shape in zip(("time", "pos", "v"), shapes)]
+        
+        self.chunks += 1
+        
+        self.filled = 0
+        
+    # This function flushes the current chunk to disk, cutting its files down to the
+    # snapshots actually written if the chunk was not filled.
+    # @param self the bound version of this object
+    def finishchunk(self):
+        
+        if(self.arrays is None):
+            
+            return
+        
+        for array in self.arrays:
+            
+            array.flush()
+            
+        filled = [np.array(array[:self.filled]) for array in self.arrays] if self.filled < self.chunk else None
+        
+        self.arrays = None #unmaps the files before any of them is rewritten
+        
+        if(filled is not None):
+            
+            for name, array in zip(("time", "pos", "v"), filled):
+                
+                np.save(self.chunkpath(name, self.chunks - 1), array)
+        
+    # This function drops the snapshots after a given time from the chunk files already on
+    # disk, so a run continued from a checkpoint carries on the trajectory of the run that
+    # wrote it. Chunks left empty are deleted and the next chunk takes their number.
+    # @param self the bound version of this object
+    # @param time the simulated time of the last snapshot to keep
+    def truncate(self, time):
+        
+        self.finishchunk()
+        
+        while(self.chunks > 0):
+            
+            times = np.load(self.chunkpath("time", self.chunks - 1))
+            
+            keep = np.searchsorted(times, time, side='right')
+            
+            if(keep == len(times)):
+                
+                break
+            
+            for name in ("time", "pos", "v"):
+                
+                if(keep > 0):
+                    
+                    np.save(self.chunkpath(name, self.chunks - 1), np.load(self.chunkpath(name, self.chunks - 1))[:keep])
+                    
+                else:
+                    
+                    os.remove(self.chunkpath(name, self.chunks - 1))
+                    
+            if(keep > 0):
+                
+                break
+            
+            self.chunks -= 1
+            
+    # This function returns the path of the file of one field of a chunk.
+    # @param self the bound version of this object
+    # @param name the field ("time", "pos" or "v")
+    # @param number the number of the chunk
+    # @return the path of the .npy file
+    def chunkpath(self, name, number):
+        
+        return os.path.join(self.directory, "%s-%05d.npy" % (name, number))
+    
+    # This function flushes any partly filled chunk; the recorder may keep recording
+    # afterwards into a new chunk.
+    # @param self the bound version of this object
+    def close(self):
+        
+        self.finishchunk()
+        
+    # These functions allow the recorder to be used in a with statement that closes it.
+    # @param self the bound version of this object
+    def __enter__(self):
+        
+        return self
+    
+    def __exit__(self, *exception):
+        
+        self.close()
+
+# This function opens the chunk files written by a TrajectoryRecorder without reading
+# them into memory.
+# @param directory the directory the recorder wrote to
+# @return a list with a (times, positions, velocities) tuple of read-only memory-mapped
+#         arrays for each chunk, in order
+#
+def readtrajectory(directory):
+    
+    chunks = []
+    
+    number = 0
+    
+    while(os.path.exists(os.path.join(directory, "time-%05d.npy" % number))):
+        
+        chunks.append(tuple(np.load(os.path.join(directory, "%s-%05d.npy" % (name, number)), mmap_mode='r') for name in ("time", "pos", "v")))
+        
+        number += 1
+        
+    return chunks
+
+# This class defines the methods and initializes the variables for a Checkpointer object.
+# An object of the class Checkpointer periodically saves the full state of a run of
+# evolve() (positions, velocities, masses, the integrator state, the elapsed time and the
+# run settings) to one .npz file. The arrays are copied in the calling thread, which
+# only costs a memory copy, and a background thread writes the copy to a temporary file
+# that then atomically replaces the checkpoint, so a preempted run always leaves the
+# last complete checkpoint behind. Only one write is in flight at a time.
+#
+class Checkpointer:
+    
+    # Constructor initializes all of the instance variables and starts the
+    # writer thread upon instantiation of the object.
+    # @param self the bound version of this object
+    # @param path the path of the checkpoint file
+    # @param every save a checkpoint every this many steps
+    # @param seconds save a checkpoint every this many seconds of wall-clock time instead (optional)
+    def __init__(self, path, every=100, seconds=None):
+        
+        self.path = path
+        
+        self.every = every
+        
+        self.seconds = seconds
+        
+        self.steps = 0 #the number of steps offered to the checkpointer
+        
+        self.last = timer.perf_counter() #the wall-clock time of the last checkpoint
+        
+        self.error = None #an exception raised by the writer thread
+        
+        self.queue = queue.Queue(maxsize=1)
+        
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        
+        self.writer.start()
+        
+    # This function offers the state after a step to the checkpointer, which saves
+    # it if the step or wall-clock time falls on the checkpoint cadence.
+    # @param self the bound version of this object
+    # @param system the StarSystem being evolved
+    # @param counter the simulated time elapsed in the run
+    # @param settings a dictionary with the settings of the run
+    # @return whether a checkpoint was started
+    def offer(self, system, counter, settings):
+        
+        self.steps += 1
+        
+        if(self.seconds is not None):
+            
+            if(timer.perf_counter() - self.last < self.seconds):
+                
+                return False
+            
+        elif(self.steps % self.every != 0):
+            
+            return False
+        
+        self.save(system, counter, settings)
+        
+        return True
+    
+    # This function copies the state of the run and hands it to the writer thread,
+    # waiting for the previous write to be picked up first.
+    # @param self the bound version of this object
+    # @param system the StarSystem being evolved
+    # @param counter the simulated time elapsed in the run
+    # @param settings a dictionary with the settings of the run
+    def save(self, system, counter, settings):
+        
+        if(self.error is not None):
+            
+            raise self.error
+        
+        state = {"pos": system.pos.copy(), "v": system.v.copy(), "mass": system.mass.copy(), "counter": np.array(counter), "settings": np.array(json.dumps(settings))}
+        
+        if(system.acc is not None):
+            
+            state["acc"] = np.array(system.acc)
+            
+        if(system.level is not None):
+            
+            state["level"] = system.level.copy()
+            
+        self.last = timer.perf_counter()
+        
+        self.queue.put(state)
+        
+    # This function is the loop of the writer thread, which writes each state it is
+    # handed to a temporary file and moves it over the checkpoint.
+    # @param self the bound version of this object
+    def write(self):
+        
+        while(True):
+            
+            state = self.queue.get()
+            
+            if(state is None):
+                
+                self.queue.task_done()
+                
+                return
+            
+            try:
+                
+                temporary = self.path + ".tmp"
+                
+                with open(temporary, 'wb') as file:
+                    
+                    np.savez(file, **state)
+                    
+                    file.flush()
+                    
+                    os.fsync(file.fileno())
+                    
+                os.replace(temporary, self.path)
+                
+            except Exception as error:
+                
+                self.error = error
+                
+            self.queue.task_done()
+            
+    # This function waits until every checkpoint handed to the writer is on disk.
+    # @param self the bound version of this object
+    def wait(self):
+        
+        self.queue.join()
+        
+        if(self.error is not None):
+            
+            raise self.error
+        
+    # This function waits for the last checkpoint and stops the writer thread.
+    # @param self the bound version of this object
+    def close(self):
+        
+        if(self.writer.is_alive()):
+            
+            self.queue.put(None)
+            
+            self.writer.join()
+            
+        if(self.error is not None):
+            
+            raise self.error
+        
+    # These functions allow the checkpointer to be used in a with statement that closes it.
+    # @param self the bound version of this object
+    def __enter__(self):
+        
+        return self
+    
+    def __exit__(self, *exception):
+        
+        self.close()
+
+# This function continues a run of evolve() from a checkpoint file. The system, its
+# integrator state, the elapsed time and the settings of the run are restored, so the
+# continued run produces bit-for-bit the same states as the uninterrupted run would have.
+# @param path the path of the checkpoint file
+# @param recorder a TrajectoryRecorder for the continued run, whose chunks on disk are cut
+#        back to the time of the checkpoint before it records (optional)
+# @param checkpoint a Checkpointer for the continued run (optional)
+# @param options keyword options for the force backend or integrator that could not be
+#        saved, such as timings or stats dictionaries (optional)
+# @return the StarSystem holding the evolved state
+#
+def resume(path, recorder=None, checkpoint=None, **options):
+    
+    with np.load(path) as state:
+        
+        system = StarSystem(state["pos"], state["v"], state["mass"])
+        
+        if("acc" in state):
+            
+            system.acc = np.array(state["acc"])
+            
+        if("level" in state):
+            
+            system.level = np.array(state["level"])
+            
+        counter = float(state["counter"])
+        
+        settings = json.loads(str(state["settings"]))
+        
+    saved = settings.pop("options")
+    
+    saved.update(options)
+    
+    if(recorder is not None):
+        
+        recorder.truncate(counter)
+        
+    return evolve(system, recorder=recorder, checkpoint=checkpoint, elapsed=counter, **settings, **saved)
+
+# This class defines the methods and initializes the variables for a Diagnostics object.
+# An object of the class Diagnostics samples the conserved quantities of a run of evolve()
+# every few steps: the kinetic, potential and total energy, the linear and angular
+# momentum, and the virial ratio 2K / |W|. With the serial direct sum, the potential
+# energy comes from the same pairwise distances that the force kernel computes at a
+# synchronized state (the start of a kick-then-drift step, or the end of a leapfrog or
+# velocity Verlet step), so a sample costs little more than a few O(N) sums; otherwise
+# an extra potential pass is made. The samples form a compact K x 11 time series.
+#
+class Diagnostics:
+    
+    columns = ("time", "kinetic", "potential", "energy", "px", "py", "pz", "lx", "ly", "lz", "virial")
+    
+    # Constructor initializes all of the instance variables upon
+    # instantiation of the object.
+    # @param self the bound version of this object
+    # @param every take a sample every this many steps
+    def __init__(self, every=10):
+        
+        self.every = every
+        
+        self.steps = 0 #the number of steps begun
+        
+        self.rows = [] #the samples, one row of the columns above each
+        
+        self.due = False #whether the current step is sampled
+        
+        self.potential = None #the potential of each body from the last captured force evaluation
+        
+        self.mode = None #"first", "last" or None: which force evaluation of a step is synchronized
+        
+        self.seconds = 0.0 #the wall-clock time spent on the samples themselves
+        
+    # This function wraps a force function so that, on sampled steps, the direct kernel
+    # also returns the potential of every body from its pairwise distances.
+    # @param self the bound version of this object
+    # @param force the force function used by the integrator
+    # @param system the StarSystem being evolved
+    # @param integrator the name of the integrator
+    # @param reuse whether the force function is the serial direct kernel
+    # @return the force function to give to the integrator
+    def wrap(self, force, system, integrator, reuse):
+        
+        self.mode = {"euler": "first", "leapfrog": "last", "verlet": "last"}.get(integrator) if reuse else None
+        
+        if(self.mode is None):
+            
+            return force
+        
+        # This function is the wrapped force function.
+        # @param pos an N x 3 array of positions
+        # @param mass an array of N masses
+        # @param options keyword options for the force function
+        # @return an N x 3 array with the acceleration of each body
+        def wrapped(pos, mass, **options):
+            
+            if(not self.due or (self.mode == "first" and self.potential is not None)):
+                
+                return force(pos, mass, **options)
+            
+            potential = np.zeros(len(mass))
+            
+            acc = force(pos, mass, potential=potential, **options)
+            
+            self.potential = potential
+            
+            if(self.mode == "first"):
+                
+                self.sample(system, self.time, potential)
+                
+            return acc
+        
+        return wrapped
+    
+    # This function marks the start of a step.
+    # @param self the bound version of this object
+    # @param time the simulated time at the start of the step
+    def begin(self, time):
+        
+        self.due = self.steps % self.every == 0
+        
+        self.steps += 1
+        
+        self.time = time
+        
+        self.potential = None
+        
+    # This function marks the end of a step and takes the sample of a sampled step
+    # if the force kernel did not already take it.
+    # @param self the bound version of this object
+    # @param system the StarSystem being evolved
+    # @param time the simulated time at the end of the step
+    def end(self, system, time):
+        
+        if(not self.due or self.mode == "first"):
+            
+            return
+        
+        potential = self.potential
+        
+        if(self.mode is None or potential is None or len(potential) != len(system)):
+            
+            potential = potentials(system.pos, system.mass)
+            
+        self.sample(system, time, potential)
+        
+    # This function appends one sample of the conserved quantities.
+    # @param self the bound version of this object
+    # @param system the StarSystem being evolved
+    # @param time the simulated time of the state
+    # @param potential the gravitational potential of each body
+    def sample(self, system, time, potential):
+        
+        start = timer.perf_counter()
+        
+        kinetic = 0.5 * np.dot(system.mass, np.einsum('ij,ij->i', system.v, system.v))
+        
+        pot = 0.5 * np.dot(system.mass, potential)
+        
+        momentum = system.mass @ system.v
+        
+        angular = system.mass @ np.cross(system.pos, system.v)
+        
+        virial = 2 * kinetic / abs(pot) if pot != 0 else 0.0
+        
+        self.rows.append((time, kinetic, pot, kinetic + pot, momentum[0], momentum[1], momentum[2], angular[0], angular[1], angular[2], virial))
+        
+        self.seconds += timer.perf_counter() - start
+        
+    # This function returns the samples as a K x 11 array with the columns above.
+    # @param self the bound version of this object
+    # @return the array of samples
+    def series(self):
+        
+        return np.array(self.rows, dtype=np.float64).reshape(-1, len(self.columns))
+    
+    # This function writes the samples to a .npy file.
+    # @param self the bound version of this object
+    # @param path the path of the file
+    def save(self, path):
+        
+        np.save(path, self.series())
+
+# This function calculates the gravitational potential of every body, summed in tiles
+# of target bodies. Pairs that are separated by a distance of zero are skipped.
+# @param pos an N x 3 array of positions
+# @param mass an array of N masses
+# @param tile the number of target bodies per tile, or None to choose it from maxpairs
+# @return an array with the potential of each body
+#
+def potentials(pos, mass, tile=None):
+    
+    n = len(mass)
+    
+    potential = np.zeros(n)
+    
+    if(tile is None):
+        
+        tile = max(1, maxpairs // max(n,1))
+        
+    for start in range(0, n, tile):
+        
+        stop = min(start + tile, n)
+        
+        diff = pos[start:stop, np.newaxis, :] - pos[np.newaxis, :, :]
+        
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        
+        invr = np.zeros_like(r2)
+        
+        nonzero = r2 > 0
+        
+        invr[nonzero] = r2[nonzero] ** -0.5
+        
+        potential[start:stop] = -G * (invr @ mass)
+        
+    return potential
+
+# This function measures the overhead of the diagnostics by evolving two copies of the
+# system, one without and one with a Diagnostics hook, and returns the seconds per step
+# of each and the relative overhead, printed on request.
+# @param system the StarSystem to evolve (it is not changed)
+# @param time the total amount of time in seconds
+# @param delt the change in time
+# @param every take a sample every this many steps
+# @param integrator the name of the integrator
+# @param verbose whether to print the timings
+# @return a tuple (seconds per step without, seconds per step with, relative overhead, Diagnostics)
+#
+def diagnosticsreport(system, time, delt, every=10, integrator="leapfrog", verbose=False):
+    
+    timings = []
+    
+    for diagnostics in (None, Diagnostics(every)):
+        
+        copy = StarSystem(system.pos, system.v, system.mass)
+        
+        start = timer.perf_counter()
+        
+        evolve(copy, time, delt, integrator=integrator, diagnostics=diagnostics)
+        
+        timings.append(timer.perf_counter() - start)
+        
+    steps = max(1, diagnostics.steps)
+    
+    overhead = timings[1] / timings[0] - 1
+    
+    if(verbose):
+        
+        print("seconds/step without %.4g, with %.4g, overhead %.2f%%" % (timings[0] / steps, timings[1] / steps, 100 * overhead))
+    
+    return (timings[0] / steps, timings[1] / steps, overhead, diagnostics)
+
+# This function takes in a list of Star objects (or a StarSystem), a time period, and a 
+# change in time, and allows the Star objects to evolve based on the interactions
+# due to gravitational attraction until the given time is up.
+# The gravitational forces are modeled by the equations 11 and 12 in the design document.
+# By default each step first kicks every velocity by the accelerations from the selected
+# backend and then drifts every position by the new velocities; symplectic integrators
+# of second and fourth order can be selected instead. The stars are bound to the
+# StarSystem that holds their state, so they reflect the evolved state afterwards.
+# @param stars the array with stars, or a StarSystem
+# @param time the total amount of time in seconds
+# @param delt the change in time
+# @param method the force backend, "direct" for the exact sum, "barnes_hut" for the
+#        octree approximation, "fmm" for the fast multipole method, "cutoff" for the
+#        softened near field over neighbor lists plus a cell-monopole far field, or "pm"
+#        for the periodic particle-mesh solver
+# @param options keyword options for the backend (tile, softening and precision for "direct"; theta
+#        and leafsize for "barnes_hut"; order, theta, leafsize and timings for "fmm";
+#        cutoff, skin, softening, theta, leafsize and neighbors for "cutoff", where a
+#        NeighborList is kept for the whole call if none is given; box, grid, p3m and
+#        split for "pm")
+# @param workers the number of worker processes for a parallel direct sum (optional);
+#        a ParallelForces pool is started for the call and closed afterwards
+# @param pool a ParallelForces pool of the system to reuse for the direct sum (optional)
+# @param integrator the time integrator: "euler" for the original kick-then-drift step,
+#        "leapfrog" for kick-drift-kick, "verlet" for velocity Verlet, or "yoshida" for
+#        the fourth order Yoshida / Forest-Ruth scheme, or "block" for hierarchical block
+#        timesteps with the direct sum (see blockstep for its options)
+# @param recorder a TrajectoryRecorder that is offered the state after every step (optional)
+# @param checkpoint a Checkpointer that is offered the state after every step (optional)
+# @param elapsed the simulated time already elapsed in the run, used by resume (optional)
+# @param mergeradius bodies closer than this distance are merged before each step; 0
+#        merges only bodies at exactly the same position, and None (the default) skips
+#        the merge stage
+# @param diagnostics a Diagnostics hook that samples the conserved quantities (optional)
+# @return the StarSystem holding the evolved state
+#
+def evolve(stars, time, delt, method="direct", workers=None, pool=None, integrator="euler", recorder=None, checkpoint=None, elapsed=0, mergeradius=None, diagnostics=None, **options):
+    
+    if(method not in methods):
+        
+        raise ValueError("unknown force method: " + str(method))
+    
+    if(integrator not in integrators):
+        
+        raise ValueError("unknown integrator: " + str(integrator))
+    
+    if(integrator == "block" and (method != "direct" or workers is not None or pool is not None)):
+        
+        raise ValueError("block timesteps only support the serial direct method")
+    
+    if(integrator == "block" and options.get("precision", "double") != "double"):
+        
+        raise ValueError("block timesteps only support double precision")
+    
+    step = integrators[integrator]
+    
+    if((workers is not None or pool is not None) and method != "direct"):
+        
+        raise ValueError("parallel workers only support the direct method")
+    
+    force = methods[method]
+    
+    if(method == "cutoff" and options.get("neighbors") is None):
+        
+        options["neighbors"] = NeighborList()
+    
+    system = stars if isinstance(stars, StarSystem) else makesystem(stars)
+    
+    started = None
+    
+    if(pool is None and workers is not None):
+        
+        pool = started = ParallelForces(system, workers, options.get("tile"), options.get("softening", 0), options.get("precision", "double"))
+        
+    if(pool is not None):
+        
+        force = pool.accelerations
+        
+    if(diagnostics is not None):
+        
+        force = diagnostics.wrap(force, system, integrator, force is accelerations)
+    
+    counter = elapsed
+    
+    if(checkpoint is not None):
+        
+        saved = {key: value for key, value in options.items() if value is None or isinstance(value, (bool, int, float, str))}
+        
+        settings = {"time": time, "delt": delt, "method": method, "workers": workers if isinstance(workers, int) else None, "integrator": integrator, "mergeradius": mergeradius, "options": saved}
+    
+    try:
+        
+        while(counter <= time):
+            
+            if(mergeradius is not None):
+                
+                mergeclose(system, mergeradius, pool is None) #the arrays of a worker pool cannot shrink
+            
+            if(diagnostics is not None):
+                
+                diagnostics.begin(counter)
+            
+            step(system, delt, force, options)
+            
+            counter += delt
+            
+            if(diagnostics is not None):
+                
+                diagnostics.end(system, counter)
+            
+            if(recorder is not None):
+                
+                recorder.record(system, counter)
+                
+            if(checkpoint is not None):
+                
+                checkpoint.offer(system, counter, settings)
+            
+    finally:
+        
+        if(started is not None):
+            
+            started.close()
+        
+    return system
+
+# This class defines the methods and initializes the variables for an Ensemble object.
+# An object of the class Ensemble stacks M independent systems of up to N bodies each into
+# (M, N, 3) position and velocity arrays and an (M, N) mass array, so that all of the
+# systems are advanced together by vectorized kernels. Bodies that have merged, and the
+# padding of systems with fewer than N bodies, are masked out by the (M, N) array alive.
+#
+class Ensemble:
+    
+    # Constructor initializes all of the instance variables upon
+    # instantiation of the object. The given arrays are copied.
+    # @param self the bound version of this object
+    # @param positions an M x N x 3 array of positions (in meters)
+    # @param velocities an M x N x 3 array of velocities (in m/s)
+    # @param masses an M x N array of masses (in kg)
+    # @param alive an M x N array of booleans marking the bodies that exist (optional)
+    def __init__(self, positions, velocities, masses, alive=None):
+        
+        self.pos = np.array(positions, dtype=np.float64)
+        
+        self.v = np.array(velocities, dtype=np.float64)
+        
+        self.mass = np.array(masses, dtype=np.float64)
+        
+        self.alive = np.ones(self.mass.shape, dtype=bool) if alive is None else np.array(alive, dtype=bool)
+        
+        self.mass[~self.alive] = 0
+        
+        self.v[~self.alive] = 0
+        
+        self.acc = None #the accelerations at the current positions, kept between steps by the integrators
+        
+    # This function returns the number of systems in the ensemble
+    # @param self the bound version of this object
+    # @return the number of systems
+    def __len__(self):
+        
+        return len(self.mass)
+    
+    # This function returns a StarSystem with a copy of the living bodies of one system
+    # @param self the bound version of this object
+    # @param index the number of the system
+    # @return a StarSystem with the bodies of the system
+    def getsystem(self, index):
+        
+        alive = self.alive[index]
+        
+        return StarSystem(self.pos[index][alive], self.v[index][alive], self.mass[index][alive])
+
+# This function stacks a list of StarSystem objects into an Ensemble, padding the
+# systems with fewer bodies with masked-out bodies.
+# @param systems the list of StarSystem objects
+# @return the Ensemble holding copies of the systems
+#
+def makeensemble(systems):
+    
+    m = len(systems)
+    
+    n = max([len(system) for system in systems] + [0])
+    
+    pos = np.zeros((m, n, 3))
+    
+    v = np.zeros((m, n, 3))
+    
+    mass = np.zeros((m, n))
+    
+    alive = np.zeros((m, n), dtype=bool)
+    
+    for i, system in enumerate(systems):
+        
+        count = len(system)
+        
+        pos[i, :count] = system.pos
+        
+        v[i, :count] = system.v
+        
+        mass[i, :count] = system.mass
+        
+        alive[i, :count] = True
+        
+    return Ensemble(pos, v, mass, alive)
+
+# This function calculates the gravitational acceleration of every body of every system
+# of an ensemble due to the other bodies of the same system, in one broadcast pass over
+# tiles of systems so that at most maxpairs separations are held in memory at once.
+# Masked-out bodies have zero mass and so exert no force, and with the alive mask they
+# are not targets either: their acceleration is zero, so with their zero velocity the
+# integrators neither kick nor drift them.
+# @param pos an M x N x 3 array of positions
+# @param mass an M x N array of masses
+# @param alive an M x N array of booleans marking the bodies that exist (optional)
+# @return an M x N x 3 array with the acceleration of each body
+#
+def ensembleaccelerations(pos, mass, alive=None):
+    
+    m, n = mass.shape
+    
+    if(alive is None):
+        
+        alive = np.ones((m, n), dtype=bool)
+    
+    acc = np.zeros((m, n, 3))
+    
+    tile = max(1, maxpairs // max(n * n, 1))
+    
+    for start in range(0, m, tile):
+        
+        stop = min(start + tile, m)
+        
+        diff = pos[start:stop, :, np.newaxis, :] - pos[start:stop, np.newaxis, :, :]
+        
+        r2 = np.einsum('sijk,sijk->sij', diff, diff)
+        
+        invr3 = np.zeros_like(r2)
+        
+        nonzero = (r2 > 0) & alive[start:stop, :, np.newaxis]
+        
+        invr3[nonzero] = r2[nonzero] ** -1.5
+        
+        acc[start:stop] = -G * np.einsum('sij,sijk->sik', invr3 * mass[start:stop, np.newaxis, :], diff)
+        
+    return acc
+
+# This function merges the bodies of each system of an ensemble that are closer than the
+# merge radius (or at exactly the same position for a radius of zero), as mergeclose does
+# for a single system. The pairs are found for all of the systems in vectorized passes
+# over tiles of systems, as in ensembleaccelerations; each pair is merged into its
+# lower-numbered body with the total mass and the momentum-conserving velocity, and the
+# other body is masked out. Chains of close bodies finish merging over later steps.
+# @param ensemble the Ensemble to check for mergers
+# @param radius the merge radius
+# @return the number of bodies that were absorbed
+#
+def ensemblemerge(ensemble, radius=0):
+    
+    m, n = ensemble.mass.shape
+    
+    upper = np.triu(np.ones((n, n), dtype=bool), 1)
+    
+    tile = max(1, maxpairs // max(n * n, 1))
+    
+    pairs = [np.zeros((0, 3), dtype=np.int64)]
+    
+    for start in range(0, m, tile):
+        
+        stop = min(start + tile, m)
+        
+        diff = ensemble.pos[start:stop, :, np.newaxis, :] - ensemble.pos[start:stop, np.newaxis, :, :]
+        
+        r2 = np.einsum('sijk,sijk->sij', diff, diff)
+        
+        close = ((r2 < radius * radius) if radius > 0 else (r2 == 0)) & upper #the comparison of closepairs
+        
+        close &= ensemble.alive[start:stop, :, np.newaxis] & ensemble.alive[start:stop, np.newaxis, :]
+        
+        found = np.argwhere(close)
+        
+        found[:, 0] += start
+        
+        pairs.append(found)
+        
+    absorbed = 0
+    
+    for s, i, j in np.concatenate(pairs):
+        
+        if(not (ensemble.alive[s, i] and ensemble.alive[s, j])):
+            
+            continue
+        
+        total = ensemble.mass[s, i] + ensemble.mass[s, j]
+        
+        if(total > 0):
+            
+            ensemble.v[s, i] = (ensemble.mass[s, i] * ensemble.v[s, i] + ensemble.mass[s, j] * ensemble.v[s, j]) / total
+            
+            if(radius > 0):
+                
+                ensemble.pos[s, i] = (ensemble.mass[s, i] * ensemble.pos[s, i] + ensemble.mass[s, j] * ensemble.pos[s, j]) / total
+            
+        ensemble.mass[s, i] = total
+        
+        ensemble.mass[s, j] = 0
+        
+        ensemble.v[s, j] = 0
+        
+        ensemble.alive[s, j] = False
+        
+        absorbed += 1
+        
+    if(absorbed > 0):
+        
+        ensemble.acc = None
+        
+    return absorbed
+
+# This function calculates the total energy of each system of an ensemble.
+# @param ensemble the Ensemble to evaluate
+# @return an array with the total energy of each system (in joules)
+#
+def ensembleenergy(ensemble):
+    
+    kinetic = 0.5 * np.einsum('si,sik,sik->s', ensemble.mass, ensemble.v, ensemble.v)
+    
+    diff = ensemble.pos[:, :, np.newaxis, :] - ensemble.pos[:, np.newaxis, :, :]
+    
+    r2 = np.einsum('sijk,sijk->sij', diff, diff)
+    
+    invr = np.zeros_like(r2)
+    
+    nonzero = r2 > 0
+    
+    invr[nonzero] = r2[nonzero] ** -0.5
+    
+    return kinetic - 0.5 * G * np.einsum('si,sij,sj->s', ensemble.mass, invr, ensemble.mass)
+
+# This function advances every system of an ensemble together for the given time, with the
+# same loop, step count and integrators as evolve(), merging close bodies before each step
+# when a merge radius is given.
+# @param ensemble the Ensemble to evolve
+# @param time the total amount of time in seconds
+# @param delt the change in time
+# @param integrator "euler", "leapfrog", "verlet" or "yoshida"
+# @param mergeradius bodies closer than this distance are merged before each step, or
+#        None (the default) to skip the merge stage
+# @return the evolved Ensemble
+#
+def evolveensemble(ensemble, time, delt, integrator="euler", mergeradius=None):
+    
+    if(integrator not in integrators or integrator == "block"):
+        
+        raise ValueError("unsupported ensemble integrator: " + str(integrator))
+    
+    step = integrators[integrator]
+    
+    counter = 0
+    
+    while(counter <= time):
+        
+        if(mergeradius is not None):
+            
+            ensemblemerge(ensemble, mergeradius)
+        
+        step(ensemble, delt, ensembleaccelerations, {"alive": ensemble.alive})
+        
+        counter += delt
+        
+    return ensemble
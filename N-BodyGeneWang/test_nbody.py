@@ -0,0 +1,344 @@
+import importlib.util
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+# N-Body.py is not an importable module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location("nbody", os.path.join(os.path.dirname(__file__), "N-Body.py"))
+
+nbody = importlib.util.module_from_spec(spec)
+
+spec.loader.exec_module(nbody)
+
+# This function returns the relative error of each acceleration against the reference
+# @param approx an N x 3 array of approximate accelerations
+# @param exact an N x 3 array of reference accelerations
+# @return an array with the relative error of each body
+#
+def relativeerror(approx, exact):
+
+    return np.linalg.norm(approx - exact, axis=1) / np.linalg.norm(exact, axis=1)
+
+def test_cutoff_matches_direct_sum():
+
+    system = nbody.plummer(500, 500, nbody.parsec, seed=1)
+
+    exact = nbody.accelerations(system.pos, system.mass)
+
+    with warnings.catch_warnings():
+
+        warnings.simplefilter("error")
+
+        # with an opening angle of 0 the far field is summed exactly, so only rounding is left
+        error = relativeerror(nbody.cutoffaccelerations(system.pos, system.mass, 1e16, theta=0), exact)
+
+        assert error.max() < 1e-10
+
+        # the default opening angle: median below 1%, every body below 10%
+        for cutoff in (1e16, 3e16):
+
+            error = relativeerror(nbody.cutoffaccelerations(system.pos, system.mass, cutoff), exact)
+
+            assert np.median(error) < 1e-2
+
+            assert error.max() < 1e-1
+
+def test_cutoff_softening_matches_direct_sum():
+
+    system = nbody.plummer(300, 300, nbody.parsec, seed=2)
+
+    eps = 0.05 * nbody.parsec
+
+    exact = nbody.accelerations(system.pos, system.mass, softening=eps)
+
+    error = relativeerror(nbody.cutoffaccelerations(system.pos, system.mass, 1e16, softening=eps, theta=0), exact)
+
+    assert error.max() < 1e-10
+
+# This function returns random pairs of unit masses at a given separation in a unit box
+# @param count the number of pairs
+# @param separation the distance between the bodies of each pair
+# @param seed the seed of the random numbers
+# @return a list of (pos, mass) tuples
+#
+def randompairs(count, separation, seed):
+
+    rng = np.random.default_rng(seed)
+
+    pairs = []
+
+    for _ in range(count):
+
+        start = rng.uniform(0, 1, 3)
+
+        direction = rng.normal(size=3)
+
+        pairs.append((np.array([start, start + separation * direction / np.linalg.norm(direction)]), np.ones(2)))
+
+    return pairs
+
+def test_particlemesh_matches_direct_for_separated_pairs():
+
+    with warnings.catch_warnings():
+
+        warnings.simplefilter("error")
+
+        # 6.4 and 8 grid spacings apart, well beyond the smoothing, so the periodic images
+        # (below 1%) and the mesh are the only errors: every body within 3%
+        for separation in (0.1, 0.125):
+
+            for pos, mass in randompairs(20, separation, 4):
+
+                error = relativeerror(nbody.particlemesh(pos, mass, 1.0, grid=64), nbody.accelerations(pos, mass))
+
+                assert error.max() < 3e-2
+
+def test_p3m_matches_direct_for_close_pairs():
+
+    with warnings.catch_warnings():
+
+        warnings.simplefilter("error")
+
+        # below the grid spacing and across the force split: every body within 5%
+        for separation in (0.01, 0.03, 0.05, 0.08):
+
+            for pos, mass in randompairs(20, separation, 5):
+
+                error = relativeerror(nbody.particlemesh(pos, mass, 1.0, grid=64, p3m=True), nbody.accelerations(pos, mass))
+
+                assert error.max() < 5e-2
+
+def test_block_jerks_are_softened():
+
+    system = nbody.plummer(50, 50, nbody.parsec, seed=6)
+
+    eps = 0.1 * nbody.parsec
+
+    everyone = np.arange(50)
+
+    acc, jerk = nbody.accelerationsjerks(system.pos, system.v, system.mass, everyone, softening=eps)
+
+    assert relativeerror(acc, nbody.accelerations(system.pos, system.mass, softening=eps)).max() < 1e-12
+
+    # the jerk is the time derivative of the softened acceleration along the velocities
+    dt = 1e7
+
+    ahead = nbody.accelerations(system.pos + system.v * dt, system.mass, softening=eps)
+
+    behind = nbody.accelerations(system.pos - system.v * dt, system.mass, softening=eps)
+
+    assert relativeerror((ahead - behind) / (2 * dt), jerk).max() < 1e-4
+
+def test_block_rejects_single_precision():
+
+    system = nbody.plummer(10, 10, nbody.parsec, seed=7)
+
+    with pytest.raises(ValueError, match="double precision"):
+
+        nbody.evolve(system, 1e10, 1e10, integrator="block", precision="single")
+
+def test_ensemble_masked_bodies_stay_put():
+
+    systems = [nbody.plummer(8, 8, nbody.parsec, seed=8), nbody.plummer(5, 5, nbody.parsec, seed=9)]
+
+    # a body on top of another is merged away at the first step
+    systems[0] = nbody.StarSystem(np.vstack((systems[0].pos, systems[0].pos[:1])), np.vstack((systems[0].v, systems[0].v[:1])), np.append(systems[0].mass, systems[0].mass[0]))
+
+    ensemble = nbody.makeensemble(systems)
+
+    nbody.evolveensemble(ensemble, 1e12, 1e11, integrator="leapfrog", mergeradius=0)
+
+    assert not ensemble.alive[0, 8] and not ensemble.alive[1, 5:].any()
+
+    assert np.array_equal(ensemble.pos[0, 8], systems[0].pos[8])
+
+    assert np.array_equal(ensemble.pos[1, 5:], np.zeros((4, 3)))
+
+    assert not ensemble.v[~ensemble.alive].any()
+
+def test_ensemble_merge_matches_across_tiles(monkeypatch):
+
+    systems = [nbody.plummer(6, 6, nbody.parsec, seed=seed) for seed in range(10, 15)]
+
+    merged = []
+
+    for maxpairs in (nbody.maxpairs, 36):
+
+        monkeypatch.setattr(nbody, "maxpairs", maxpairs)
+
+        ensemble = nbody.makeensemble(systems)
+
+        count = nbody.ensemblemerge(ensemble, 0.5 * nbody.parsec)
+
+        merged.append((count, ensemble.alive.copy(), ensemble.mass.copy()))
+
+    assert merged[0][0] > 0 and merged[0][0] == merged[1][0]
+
+    assert np.array_equal(merged[0][1], merged[1][1]) and np.array_equal(merged[0][2], merged[1][2])
+
+def test_mergeclose_keeps_absorbed_bodies_out_of_later_searches():
+
+    for radius in (0, 0.1 * nbody.parsec):
+
+        system = nbody.plummer(6, 6, nbody.parsec, seed=16)
+
+        system = nbody.StarSystem(np.vstack((system.pos, system.pos[:1])), np.vstack((system.v, system.v[:1])), np.append(system.mass, system.mass[0]))
+
+        assert nbody.mergeclose(system, radius, compact=False) == 1
+
+        mass = system.mass.copy()
+
+        system.acc = nbody.accelerations(system.pos, system.mass)
+
+        acc = system.acc
+
+        assert nbody.mergeclose(system, radius, compact=False) == 0
+
+        assert system.acc is acc and np.array_equal(system.mass, mass)
+
+def test_closepairs_matches_brute_force():
+
+    rng = np.random.default_rng(17)
+
+    # a compact cloud uses the table of cells, a few far outliers force the sorted search
+    for pos in (rng.uniform(0, 1, (1500, 3)), np.vstack((rng.uniform(0, 1, (1500, 3)), rng.uniform(0, 1e3, (10, 3))))):
+
+        left, right = nbody.closepairs(pos, 0.05)
+
+        distance = np.linalg.norm(pos[:, np.newaxis] - pos[np.newaxis], axis=2)
+
+        expected = np.argwhere(np.triu(distance < 0.05, 1))
+
+        assert np.all(left < right)
+
+        assert sorted(zip(left.tolist(), right.tolist())) == [tuple(pair) for pair in expected.tolist()]
+
+def test_cutoff_far_walk_skips_the_near_pairs():
+
+    system = nbody.plummer(400, 400, nbody.parsec, seed=18)
+
+    cutoff = 1e16
+
+    evaluated = []
+
+    def weight(r2):
+
+        evaluated.append(r2.copy())
+
+        return (1 - nbody.nearfraction(r2, cutoff)) * r2 ** -1.5
+
+    # with an opening angle of 0 every pair is summed directly, and none inside half of the cutoff
+    far = nbody.treeaccelerations(system.pos, system.mass, 0, 8, weight, cutoff / 2)
+
+    assert np.concatenate(evaluated).min() >= (cutoff / 2) ** 2
+
+    diff = system.pos[np.newaxis, :, :] - system.pos[:, np.newaxis, :]
+
+    r2 = np.einsum('ijk,ijk->ij', diff, diff)
+
+    factor = np.zeros_like(r2)
+
+    factor[r2 > 0] = (1 - nbody.nearfraction(r2[r2 > 0], cutoff)) * r2[r2 > 0] ** -1.5
+
+    assert relativeerror(far, nbody.G * np.einsum('ij,ijk->ik', factor * system.mass, diff)).max() < 1e-10
+
+def test_barneshut_opens_the_nodes_around_a_target():
+
+    # the root holds all three bodies, and at theta = 1 it would pass the opening test for
+    # the body at the origin, which would then be attracted by its own mass as well; only
+    # the monopole of the other two is left (an error of about 0.1%)
+    pos = np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0], [1.0, 1.0, 0.9]])
+
+    mass = np.ones(3)
+
+    error = relativeerror(nbody.barneshut(pos, mass, theta=1.0, leafsize=1), nbody.accelerations(pos, mass))
+
+    assert error.max() < 1e-2
+
+def test_getstar_views_follow_compaction():
+
+    system = nbody.plummer(5, 5, nbody.parsec, seed=19)
+
+    system = nbody.StarSystem(np.vstack((system.pos, system.pos[:1])), np.vstack((system.v, system.v[:1])), np.append(system.mass, system.mass[0]))
+
+    stars = [system.getstar(i) for i in range(6)]
+
+    assert all(system.getstar(i) is stars[i] for i in range(6))
+
+    assert nbody.mergeclose(system, 0) == 1
+
+    # the absorbed last body is detached, and every other view keeps its row
+    assert stars[5].system is None and 5 not in system.stars
+
+    assert all(system.getstar(i) is stars[i] and stars[i].index == i for i in range(5))
+
+def test_resumed_recorder_continues_the_trajectory(tmp_path):
+
+    system = nbody.plummer(6, 6, nbody.parsec, seed=20)
+
+    with nbody.TrajectoryRecorder(str(tmp_path / "whole"), chunk=4) as recorder:
+
+        nbody.evolve(nbody.StarSystem(system.pos, system.v, system.mass), 1.1e12, 1e11, integrator="leapfrog", recorder=recorder)
+
+    # the run takes 12 steps and the last checkpoint is at step 10, so the run recorded two
+    # snapshots past it, and the resumed run records them again
+    with nbody.TrajectoryRecorder(str(tmp_path / "split"), chunk=4) as recorder, nbody.Checkpointer(str(tmp_path / "state.npz"), every=5) as checkpoint:
+
+        nbody.evolve(nbody.StarSystem(system.pos, system.v, system.mass), 1.1e12, 1e11, integrator="leapfrog", recorder=recorder, checkpoint=checkpoint)
+
+    with nbody.TrajectoryRecorder(str(tmp_path / "split"), chunk=4) as recorder:
+
+        nbody.resume(str(tmp_path / "state.npz"), recorder=recorder)
+
+    whole, split = (nbody.readtrajectory(str(tmp_path / name)) for name in ("whole", "split"))
+
+    for field in range(3):
+
+        assert np.array_equal(np.concatenate([chunk[field] for chunk in whole]), np.concatenate([chunk[field] for chunk in split]))
+
+def test_ensemble_merge_uses_the_comparison_of_closepairs():
+
+    # two bodies exactly one merge radius apart are not merged by either search
+    pos = np.array([[0.0, 0.0, 0.0], [3.0, 0.0, 0.0], [3.0, 0.0, 0.0]])
+
+    assert nbody.mergeclose(nbody.StarSystem(pos[:2], np.zeros((2, 3)), np.ones(2)), 3.0) == 0
+
+    assert nbody.ensemblemerge(nbody.makeensemble([nbody.StarSystem(pos[:2], np.zeros((2, 3)), np.ones(2))]), 3.0) == 0
+
+    # and with a radius of zero only the bodies at the same position are merged
+    assert nbody.ensemblemerge(nbody.makeensemble([nbody.StarSystem(pos, np.zeros((3, 3)), np.ones(3))]), 0) == 1
+
+def test_fmmcheck_chooses_an_order_that_meets_the_tolerance():
+
+    system = nbody.plummer(2000, 2000, nbody.parsec, seed=21)
+
+    for tolerance, theta in ((1e-2, 0.5), (1e-3, 0.3)):
+
+        met, maxerror, rmserror, timings = nbody.fmmcheck(system, tolerance, theta=theta, sample=300)
+
+        assert met and maxerror <= tolerance
+
+def test_resume_from_a_checkpoint_is_bit_identical(tmp_path):
+
+    system = nbody.plummer(8, 8, nbody.parsec, seed=22)
+
+    for integrator in ("leapfrog", "yoshida", "block"):
+
+        whole = nbody.evolve(nbody.StarSystem(system.pos, system.v, system.mass), 1.1e12, 1e11, integrator=integrator)
+
+        # the run takes 12 steps and the checkpoint is left at step 10
+        path = str(tmp_path / ("%s.npz" % integrator))
+
+        with nbody.Checkpointer(path, every=5) as checkpoint:
+
+            nbody.evolve(nbody.StarSystem(system.pos, system.v, system.mass), 1.1e12, 1e11, integrator=integrator, checkpoint=checkpoint)
+
+        with np.load(path) as state:
+
+            assert float(state["counter"]) < 1.1e12
+
+        resumed = nbody.resume(path)
+
+        assert np.array_equal(resumed.pos, whole.pos) and np.array_equal(resumed.v, whole.v) and np.array_equal(resumed.mass, whole.mass)
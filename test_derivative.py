@@ -0,0 +1,151 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+import Derivative
+
+def test_spectral_periodic_is_spectrally_accurate():
+
+    x = 2*np.pi*np.arange(32)/32
+
+    estimate = Derivative.spectral(np.sin(3*x),x[1]-x[0])
+
+    assert np.abs(estimate - 3*np.cos(3*x)).max() < 1e-12
+
+def test_chebyshev_is_exact_for_polynomials_on_a_bounded_domain():
+
+    x = Derivative.chebyshevpoints(17,(0,2))
+
+    assert np.abs(Derivative.chebyshev(x**5 - 3*x**2,(0,2)) - (5*x**4 - 6*x)).max() < 1e-10
+
+def test_batchderivative_builds_the_grid_from_h():
+
+    x = 0.1*np.arange(40)
+
+    values = np.stack((np.sin(x),np.exp(x/4)))
+
+    for method in ("twopoint","threepoint","fivepoint","parabolic"):
+
+        expected = Derivative.batchderivative(values,x=x,method=method)
+
+        assert np.allclose(Derivative.batchderivative(values,h=0.1,method=method),expected,rtol=1e-10,atol=1e-10)
+
+def test_batchderivative_needs_x_or_h():
+
+    with pytest.raises(ValueError, match="x values or the step size h"):
+
+        Derivative.batchderivative(np.zeros((2,10)),method="twopoint")
+
+def test_errormetrics_relative_to_a_zero_reference():
+
+    actual = np.column_stack((np.arange(5.0),np.zeros(5)))
+
+    metrics = Derivative.errormetrics(actual,np.array([np.zeros(5),np.ones(5)]))
+
+    assert np.isnan(metrics["relative"][0])
+
+    assert np.isinf(metrics["relative"][1])
+
+    metrics = Derivative.errormetrics(np.column_stack((np.arange(5.0),np.full(5,2.0))),np.array([np.ones(5)]))
+
+    assert np.allclose(metrics["relative"],0.5)
+
+def test_convergencestudy_fits_the_order_of_each_method(capsys):
+
+    table,orders = Derivative.convergencestudy(methods=("twopoint","threepoint","fivepoint"),steps=(0.2,0.1,0.05,0.025),workers=1)
+
+    for name in ("gaussian","sinc"):
+
+        assert abs(orders[(name,"twopoint")] - 2) < 0.1
+
+        assert abs(orders[(name,"threepoint")] - 2) < 0.1
+
+        assert abs(orders[(name,"fivepoint")] - 4) < 0.2
+
+    assert capsys.readouterr().out == ""
+
+def test_fornberg_gives_the_exact_weights():
+
+    nodes = lambda offsets: np.array([Fraction(o) for o in offsets],dtype=object)
+
+    assert list(Derivative.fornberg(Fraction(0),nodes((-1,0,1)),1)) == [Fraction(-1,2),0,Fraction(1,2)]
+
+    assert list(Derivative.fornberg(Fraction(0),nodes((-2,-1,0,1,2)),1)) == [Fraction(1,12),Fraction(-2,3),0,Fraction(2,3),Fraction(-1,12)]
+
+    assert list(Derivative.fornberg(Fraction(0),nodes((-2,-1,0,1,2)),2)) == [Fraction(-1,12),Fraction(4,3),Fraction(-5,2),Fraction(4,3),Fraction(-1,12)]
+
+    # one-sided and uneven nodes, and a point between the nodes
+    assert list(Derivative.fornberg(Fraction(0),nodes((0,1,3)),1)) == [Fraction(-4,3),Fraction(3,2),Fraction(-1,6)]
+
+    assert list(Derivative.fornberg(Fraction(1,2),nodes((0,1)),1)) == [-1,1]
+
+def test_stencilweights_match_the_exact_weights():
+
+    assert list(Derivative.stencilweights(1,(-1,0,1))) == [-0.5,0,0.5]
+
+    assert list(Derivative.stencilweights(1,(-2,-1,0,1,2))) == [float(Fraction(w)) for w in ("1/12","-2/3","0","2/3","-1/12")]
+
+    assert list(Derivative.stencilweights(4,(-2,-1,0,1,2))) == [1,-4,6,-4,1]
+
+def test_richardson_reaches_the_tolerance():
+
+    x = np.linspace(-1,1,9)
+
+    for order in (1,2):
+
+        for tolerance in (1e-6,1e-10):
+
+            derivative,error,count = Derivative.richardson(np.exp,x,order=order,tolerance=tolerance)
+
+            assert np.all(error <= tolerance*np.abs(derivative))
+
+            assert np.all(np.abs(derivative - np.exp(x)) <= tolerance*np.exp(x))
+
+def test_richardson_reports_an_unreachable_tolerance():
+
+    x = np.linspace(-1,1,9)
+
+    # round-off stops the extrapolation far above a relative error of 1e-20, and the
+    # error estimate says so while the derivative is still the best one found
+    derivative,error,count = Derivative.richardson(np.exp,x,tolerance=1e-20)
+
+    assert np.all(error > 1e-20*np.abs(derivative))
+
+    assert np.all(np.abs(derivative - np.exp(x)) <= 1e-12*np.exp(x))
+
+def test_chunked_and_batch_derivatives_match_estimate_exactly(tmp_path):
+
+    uneven = np.sort(np.random.default_rng(1).uniform(0,10,103))
+
+    for method in ("twopoint","threepoint","fivepoint","parabolic"):
+
+        h = 0.1 if method == "fivepoint" else None
+
+        x = 0.1*np.arange(103) if method == "fivepoint" else uneven
+
+        arr = np.column_stack((x,np.sin(x)))
+
+        expected = Derivative.estimate(arr,method,h=h)
+
+        # 103 rows split into chunks of 7 (and of 1, smaller than the halo) leave a
+        # short last chunk, and every chunk boundary reads its neighbors from the halo
+        for chunk in (1,7,50):
+
+            assert np.array_equal(Derivative.chunkedderivative(arr,np.zeros_like(arr),method,h=h,chunk=chunk),expected)
+
+        np.save(tmp_path / "source.npy",arr)
+
+        Derivative.chunkedderivative(str(tmp_path / "source.npy"),str(tmp_path / "result.npy"),method,h=h,chunk=7)
+
+        assert np.array_equal(np.load(tmp_path / "result.npy"),expected)
+
+        assert np.array_equal(np.load(tmp_path / "source.npy"),arr)
+
+        values = np.stack((np.sin(x),np.cos(x)))
+
+        result = Derivative.batchderivative(values,x=x,h=h,method=method)
+
+        assert np.array_equal(result[0],expected[:,1])
+
+        assert np.array_equal(result[1],Derivative.estimate(np.column_stack((x,np.cos(x))),method,h=h)[:,1])